@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import unittest
+import asyncio
+from diff_dbs import AdaptiveLimit
+
+
+class TestAdaptiveLimit(unittest.TestCase):
+
+    def test_increases_up_to_maximum(self):
+        limit = AdaptiveLimit(4)
+        for _ in range(2):
+            limit.record(0.1)
+        self.assertEqual(2.5, limit.limit)
+        for _ in range(20):
+            limit.record(0.1)
+        self.assertEqual(4, limit.limit)
+
+    def test_failure_halves(self):
+        limit = AdaptiveLimit(8, 8)
+        limit.record(0.1, failed=True)
+        self.assertEqual(4, limit.limit)
+
+    def test_decreases_once_per_window(self):
+        limit = AdaptiveLimit(8, 8)
+        for _ in range(4):
+            limit.record(0.1, failed=True)
+        self.assertEqual(4, limit.limit)
+        limit.record(0.1, failed=True)
+        self.assertEqual(2, limit.limit)
+
+    def test_slow_call_decreases(self):
+        limit = AdaptiveLimit(8, 4)
+        limit.record(0.1)
+        before = limit.limit
+        limit.record(0.1 * AdaptiveLimit.LATENCY_FACTOR * 2)
+        self.assertEqual(before / 2, limit.limit)
+
+    def test_never_below_one(self):
+        limit = AdaptiveLimit(8)
+        for _ in range(5):
+            limit.record(1, failed=True)
+        self.assertEqual(1, limit.limit)
+
+    def test_in_flight_bounded(self):
+        limit = AdaptiveLimit(2, 2)
+        peak = []
+
+        async def call():
+            await limit.acquire()
+            peak.append(limit.in_flight)
+            await asyncio.sleep(0.01)
+            await limit.release()
+
+        async def calls():
+            await asyncio.gather(*[call() for _ in range(6)])
+
+        asyncio.run(calls())
+        self.assertEqual(2, max(peak))
+        self.assertEqual(0, limit.in_flight)
+
+
+if __name__ == '__main__':
+    unittest.main()
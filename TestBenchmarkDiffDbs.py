@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import tempfile
+import time
+from unittest.mock import patch
+import fake_keepassxc_cli
+from fake_keepassxc_cli import FakeDatabase
+from diff_dbs import CompactEntry, DBEntry, Fingerprinter, read_database_content
+from benchmark_diff_dbs import generate_entries, mutate_entries, create_vaults, timed_hashing, run_case, \
+    parse_with_prefix_checks, show_output, benchmark_parser, benchmark_memory, CASE_READ, CASE_DIFF, PASSWORD
+
+
+class TestBenchmarkDiffDbs(unittest.TestCase):
+
+    def test_generate_entries(self):
+        entries = generate_entries(200, depth=2, notes_length=30)
+        self.assertEqual(200, len(entries))
+        self.assertEqual(entries, generate_entries(200, depth=2, notes_length=30))
+        self.assertEqual(200, len({entry['path'] for entry in entries}))
+        self.assertLessEqual(max(entry['path'].count('/') for entry in entries), 2)
+        self.assertTrue(all(len(entry['notes']) <= 30 for entry in entries))
+
+    def test_mutate_entries(self):
+        entries = generate_entries(300)
+        mutated = mutate_entries(entries, fraction=0.01)
+        self.assertEqual(300, len(mutated))
+        paths = {entry['path'] for entry in entries}
+        self.assertEqual(3, len([entry for entry in mutated if entry['path'] not in paths]))
+        self.assertEqual(generate_entries(300), entries)
+
+    def test_vaults_are_readable(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND):
+            first, _ = create_vaults(directory, 25)
+            self.assertEqual(25, len(read_database_content(first, PASSWORD)))
+
+    def test_unlock_cost(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.dict(os.environ, {fake_keepassxc_cli.UNLOCK_COST_VARIABLE: '0.2',
+                                        fake_keepassxc_cli.LATENCY_VARIABLE: '0.1'}), \
+                patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND):
+            path = os.path.join(directory, 'db.json')
+            FakeDatabase.save(path, PASSWORD, [{'path': 'entry'}])
+            start = time.perf_counter()
+            read_database_content(path, PASSWORD)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+
+    def test_benchmark_parser(self):
+        for entry in generate_entries(50):
+            self.assertEqual(parse_with_prefix_checks(show_output(entry)), DBEntry.parse_lines(show_output(entry)))
+        self.assertEqual(['prefix checks', 'dispatch table'], [name for name, _ in benchmark_parser(10)])
+
+    def test_benchmark_memory(self):
+        sizes = dict(benchmark_memory(200))
+        self.assertLess(sizes['compact'] * 3, sizes['full'])
+
+    def test_timed_hashing(self):
+        with timed_hashing() as spent:
+            Fingerprinter().fingerprint('value')
+            DBEntry('path', 'title').digest()
+            fields = (DBEntry.FIELD_TITLE, DBEntry.FIELD_URL)
+            CompactEntry.from_entry(DBEntry('path', 'title'), fields).digest(fields)
+        self.assertEqual(5, len(spent))
+        self.assertNotIn('wrapper', Fingerprinter.fingerprint.__code__.co_name)
+
+    def test_run_case(self):
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ), \
+                patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND):
+            first, second = create_vaults(directory, 40)
+            read = run_case(CASE_READ, first, second, backend='show', jobs=2)
+            diff = run_case(CASE_DIFF, first, second)
+        self.assertEqual(40, read['results'])
+        self.assertGreaterEqual(read['processes'], 41)
+        self.assertEqual(3, diff['results'])
+        self.assertEqual(2, diff['processes'])
+        self.assertGreater(diff['hashing_time'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
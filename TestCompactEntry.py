@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import unittest
+import random
+import tracemalloc
+from parameterized import parameterized
+from diff_dbs import CompactEntry, DBEntry, compact, convert, detect_moves, diff_tree
+
+
+class TestCompactEntry(unittest.TestCase):
+
+    def entry(self, path, user_name='u', notes='notes', url=None):
+        return DBEntry(path, path.rpartition('/')[2], user_name, 'hash', url, notes)
+
+    def test_no_instance_dictionary(self):
+        for entry in (self.entry('a'), CompactEntry.from_entry(self.entry('a'))):
+            with self.assertRaises(AttributeError):
+                entry.__dict__
+
+    def test_group_is_interned(self):
+        first = CompactEntry.from_entry(self.entry(''.join(['g/h/', 'a'])))
+        second = CompactEntry.from_entry(self.entry(''.join(['g/', 'h/b'])))
+        self.assertIs(first.group, second.group)
+        root = CompactEntry.from_entry(self.entry('a'))
+        self.assertEqual(('g/h/a', 'g/h/b', 'a'), (first.path, second.path, root.path))
+
+    def test_fixed_size(self):
+        entry = CompactEntry.from_entry(self.entry('a', notes='n' * 100000))
+        self.assertEqual(len(DBEntry.FIELDS) * CompactEntry.FIELD_DIGEST_SIZE, len(entry.digests))
+
+    @parameterized.expand([
+        ('same', {}, []),
+        ('user name', {'user_name': 'v'}, [DBEntry.FIELD_USERNAME]),
+        ('notes', {'notes': 'other'}, [DBEntry.FIELD_NOTES]),
+        ('missing url', {'url': ''}, [DBEntry.FIELD_URL]),
+    ])
+    def test_differing_fields(self, _, changes, expected):
+        first = self.entry('a')
+        second = self.entry('a', **changes)
+        self.assertEqual(expected, CompactEntry.from_entry(first).differing_fields(CompactEntry.from_entry(second)))
+        self.assertEqual(first.differing_fields(second),
+                         CompactEntry.from_entry(first).differing_fields(CompactEntry.from_entry(second)))
+
+    def test_has_value(self):
+        entry = CompactEntry.from_entry(self.entry('a', user_name='', notes=None, url='u'))
+        self.assertEqual([False, False, True], [entry.has_value(field) for field in
+                                                (DBEntry.FIELD_USERNAME, DBEntry.FIELD_NOTES, DBEntry.FIELD_URL)])
+
+    def test_digest_of_field_subset(self):
+        fields = (DBEntry.FIELD_USERNAME, DBEntry.FIELD_PASSWORD)
+        first = CompactEntry.from_entry(self.entry('a', notes='x'))
+        second = CompactEntry.from_entry(self.entry('b', notes='y'))
+        self.assertEqual(first.digest(fields), second.digest(fields))
+        self.assertNotEqual(first.digest(), second.digest())
+
+    def test_diff_matches_full_entries(self):
+        generator = random.Random(7)
+        first = [self.entry('g%d/e%d' % (index % 5, index), generator.choice('uv'), generator.choice('nm'))
+                 for index in range(300)]
+        second = [self.entry(entry.path, generator.choice('uv'), entry.notes)
+                  for entry in first if generator.random() < 0.9]
+        expected = [(result.kind, result.path, result.fields)
+                    for result in detect_moves(diff_tree(convert(first), convert(second)))]
+        actual = [(result.kind, result.path, result.fields)
+                  for result in detect_moves(diff_tree(convert(compact(first)), convert(compact(second))))]
+        self.assertEqual(expected, actual)
+
+    def test_memory(self):
+        def allocated(create):
+            tracemalloc.start()
+            try:
+                entries = create()
+                return tracemalloc.get_traced_memory()[0], entries
+            finally:
+                tracemalloc.stop()
+
+        def full():
+            return [self.entry('group/entry%d' % index, 'user%d' % index, 'notes %d ' % index * 20,
+                               'https://example.com/%d' % index)
+                    for index in range(2000)]
+
+        full_size, entries = allocated(full)
+        compact_size, _ = allocated(lambda: list(compact(entries)))
+        self.assertLess(compact_size * 3, full_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
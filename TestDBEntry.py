@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
 import unittest
+import random
 from parameterized import parameterized
-from diff_dbs import DBEntry
+from diff_dbs import DBEntry, Fingerprinter, RUN_FINGERPRINTER
 
 
 class TestDBEntry(unittest.TestCase):
@@ -46,7 +47,7 @@ class TestDBEntry(unittest.TestCase):
                        notes='nnn')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
     def test_from_lines_empty_title(self):
@@ -57,7 +58,7 @@ class TestDBEntry(unittest.TestCase):
                        notes='nnn')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
     def test_from_lines_empty_username(self):
@@ -68,7 +69,7 @@ class TestDBEntry(unittest.TestCase):
                        notes='nnn')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
     def test_from_lines_empty_password(self):
@@ -79,7 +80,7 @@ class TestDBEntry(unittest.TestCase):
                        url='https://www.gmail.com', notes='nnn')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
     def test_from_lines_empty_url(self):
@@ -89,7 +90,7 @@ class TestDBEntry(unittest.TestCase):
                        password_hash=DBEntry.create_password_hash(password, salt), url='', notes='nnn')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
     def test_from_lines_empty_notes(self):
@@ -100,7 +101,7 @@ class TestDBEntry(unittest.TestCase):
                        notes='')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
     def test_from_lines_full(self):
@@ -111,9 +112,119 @@ class TestDBEntry(unittest.TestCase):
                        notes='nnn')
         right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'UserName: ' + left.user_name,
                                                'Password: ' + password, 'URL: ' + left.url,
-                                               'Notes: ' + left.notes], salt)
+                                               'Notes: ' + left.notes], salt, None)
         self.assertDBEntryEqual(left, right)
 
+    def test_from_lines_uses_run_fingerprinter_by_default(self):
+        left = DBEntry(path='/a/b', title='testtitle', password_hash=RUN_FINGERPRINTER.fingerprint('pw'))
+        right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'Password: pw'], 'salt')
+        self.assertDBEntryEqual(left, right)
+
+    def test_from_lines_with_fingerprinter(self):
+        fingerprinter = Fingerprinter()
+        left = DBEntry(path='/a/b', title='testtitle', password_hash=fingerprinter.fingerprint('pw'))
+        right = DBEntry.from_lines(left.path, ['Title: ' + left.title, 'Password: pw'], 'salt', fingerprinter)
+        self.assertDBEntryEqual(left, right)
+
+    def test_password_hash_is_lazy(self):
+        hashed = []
+        entry = DBEntry(path='/a/b')
+        entry.set_password('pw', lambda password: hashed.append(password) or 'hash')
+        self.assertTrue(entry.is_same(DBEntry(path='/a/b', password_hash='other'), ignore_password=True))
+        self.assertEqual([], hashed)
+        self.assertEqual('hash', entry.password_hash)
+        self.assertEqual('hash', entry.password_hash)
+        self.assertEqual(['pw'], hashed)
+
+    def test_from_lines_skips_ignored_fields(self):
+        right = DBEntry.from_lines('/a/b', ['Title: testtitle', 'UserName: test_username', 'Password: pw',
+                                            'URL: https://www.gmail.com', 'Notes: nnn'], 'salt',
+                                   fields=(DBEntry.FIELD_TITLE, DBEntry.FIELD_URL))
+        self.assertDBEntryEqual(DBEntry(path='/a/b', title='testtitle', url='https://www.gmail.com'), right)
+
+    def test_show_attributes(self):
+        self.assertEqual(['-a', 'UserName', '-a', 'Notes'],
+                         DBEntry.show_attributes((DBEntry.FIELD_USERNAME, DBEntry.FIELD_NOTES)))
+        self.assertEqual(['-a', 'Title'], DBEntry.show_attributes(()))
+
+    def test_from_attribute_lines(self):
+        fingerprinter = Fingerprinter()
+        left = DBEntry(path='/a/b', user_name='test_username', password_hash=fingerprinter.fingerprint('pw'),
+                       notes='first line\nsecond line')
+        right = DBEntry.from_attribute_lines(left.path, ['test_username', 'pw', 'first line', 'second line'],
+                                             'salt', fingerprinter,
+                                             (DBEntry.FIELD_USERNAME, DBEntry.FIELD_PASSWORD, DBEntry.FIELD_NOTES))
+        self.assertDBEntryEqual(left, right)
+
+    def test_digest_same_values(self):
+        left = DBEntry(path='/a/b', title='testtitle', user_name='test_username', password_hash='hash',
+                       url='https://www.gmail.com', notes='nnn')
+        right = DBEntry(path='/a/c', title='testtitle', user_name='test_username', password_hash='hash',
+                        url='https://www.gmail.com', notes='nnn')
+        self.assertEqual(left.digest(), right.digest())
+        self.assertEqual(DBEntry.DIGEST_SIZE, len(left.digest()))
+
+    def test_digest_only_covers_given_fields(self):
+        left = DBEntry(title='testtitle', notes='nnn')
+        right = DBEntry(title='testtitle', notes='nnn2')
+        self.assertNotEqual(left.digest(), right.digest())
+        self.assertEqual(left.digest((DBEntry.FIELD_TITLE, )), right.digest((DBEntry.FIELD_TITLE, )))
+
+    def test_digest_separates_fields(self):
+        self.assertNotEqual(DBEntry(title='ab', user_name='').digest(), DBEntry(title='a', user_name='b').digest())
+        self.assertNotEqual(DBEntry(title='').digest(), DBEntry(title=None).digest())
+
+    def test_fingerprinted(self):
+        fingerprinter = Fingerprinter()
+        entry = DBEntry(path='/a/b', title='testtitle', user_name='test_username', password_hash='hash',
+                        notes='nnn').fingerprinted(fingerprinter, (DBEntry.FIELD_TITLE, DBEntry.FIELD_PASSWORD,
+                                                                   DBEntry.FIELD_URL))
+        self.assertDBEntryEqual(DBEntry(path='/a/b', title=fingerprinter.fingerprint('testtitle'),
+                                        password_hash='hash'), entry)
+
+    def test_differing_fields(self):
+        left = DBEntry(title='testtitle', user_name='test_username', url='https://www.gmail.com')
+        right = DBEntry(title='testtitle', user_name='test_username2', url='https://www.gmail2.com')
+        self.assertEqual([DBEntry.FIELD_USERNAME, DBEntry.FIELD_URL], left.differing_fields(right))
+        self.assertEqual([DBEntry.FIELD_URL], left.differing_fields(right, (DBEntry.FIELD_TITLE, DBEntry.FIELD_URL)))
+
+    def test_from_export_row_root_group(self):
+        left = DBEntry(path='testtitle', title='testtitle', user_name='test_username',
+                       password_hash=DBEntry.create_password_hash('pw', 'abc'), url='https://www.gmail.com',
+                       notes='nnn')
+        right = DBEntry.from_export_row({'Group': 'Root', 'Title': 'testtitle', 'Username': 'test_username',
+                                         'Password': 'pw', 'URL': 'https://www.gmail.com', 'Notes': 'nnn'}, 'abc', None)
+        self.assertDBEntryEqual(left, right)
+
+    def test_from_export_row_nested_group(self):
+        right = DBEntry.from_export_row({'Group': 'Root/a/b', 'Title': 'testtitle', 'Username': '',
+                                         'Password': '', 'URL': '', 'Notes': ''}, 'abc')
+        self.assertEqual('a/b/testtitle', right.path)
+
+    def test_from_export_row_same_as_from_lines(self):
+        password = 'abc´"1!++#A2233m'
+        salt = 'abc'
+        left = DBEntry.from_lines('a/testtitle', ['Title: testtitle', 'UserName: test_username',
+                                                  'Password: ' + password, 'URL: https://www.gmail.com',
+                                                  'Notes: first line', 'second line'], salt)
+        right = DBEntry.from_export_row({'Group': 'Root/a', 'Title': 'testtitle', 'Username': 'test_username',
+                                         'Password': password, 'URL': 'https://www.gmail.com',
+                                         'Notes': 'first line\nsecond line'}, salt)
+        self.assertDBEntryEqual(left, right)
+
+    def test_from_export_row_skips_ignored_columns(self):
+        class Row(dict):
+            def __getitem__(self, key):
+                if key == 'Notes':
+                    raise AssertionError('ignored column read')
+                return dict.__getitem__(self, key)
+
+        right = DBEntry.from_export_row(Row({'Group': 'Root', 'Title': 'testtitle', 'Username': 'test_username',
+                                             'Password': 'pw', 'URL': '', 'Notes': 'n' * 100000}), 'abc',
+                                        fields=(DBEntry.FIELD_TITLE, DBEntry.FIELD_USERNAME))
+        self.assertEqual(('testtitle', 'test_username', None, None),
+                         (right.title, right.user_name, right.password_hash, right.notes))
+
     def test_equals_diff_class(self):
         left = DBEntry(path='/a/b', title='testtitle', user_name='test_username',
                        password_hash=DBEntry.create_password_hash('a', 'b'), url='https://www.gmail.com', notes='nnn')
@@ -173,6 +284,114 @@ class TestDBEntry(unittest.TestCase):
                         password_hash=DBEntry.create_password_hash('a', 'b'), url='https://www.gmail.com', notes='nnn2')
         self.assertNotEqual(left, right)
 
+    def random_values(self, generator):
+        alphabet = 'abcXYZ019 :/-_.äß€' + '\t'
+        headers = [DBEntry.TITLE, DBEntry.USERNAME, DBEntry.PASSWORD, DBEntry.URL, DBEntry.NOTES, 'Uuid: ', 'Tags: ']
+
+        def text():
+            value = ''.join(generator.choice(alphabet) for _ in range(generator.randint(0, 12)))
+            # values may look like headers themselves
+            return generator.choice(headers + [''] * 5) + value
+
+        # only the headers printed after the notes end them, and only where the output ends
+        notes = [text() for _ in range(generator.randint(1, 4))]
+        if len(notes) > 1 and DBEntry.is_trailing_header(notes[-1]):
+            notes.append('')
+        return {DBEntry.FIELD_TITLE: text(), DBEntry.FIELD_USERNAME: text(), DBEntry.FIELD_PASSWORD: text(),
+                DBEntry.FIELD_URL: text(), DBEntry.FIELD_NOTES: '\n'.join(notes)}
+
+    def show_lines(self, values):
+        lines = [DBEntry.FIELD_HEADERS[field] + values[field] for field in DBEntry.FIELDS[:-1]]
+        return lines + (DBEntry.NOTES + values[DBEntry.FIELD_NOTES]).split('\n')
+
+    def test_parse_lines_round_trip(self):
+        generator = random.Random(18)
+        for _ in range(500):
+            values = self.random_values(generator)
+            lines = self.show_lines(values)
+            self.assertEqual(values, DBEntry.parse_lines(lines))
+            self.assertEqual(values, DBEntry.parse_lines(lines + ['Uuid: {0}', 'Tags: a'], True))
+            self.assertEqual(values, DBEntry.parse_lines([line.encode() + b'\n' for line in lines]))
+            self.assertEqual(values, DBEntry.parse_lines([line + '\r\n' for line in lines]))
+
+    def test_from_lines_matches_prefix_checks_on_single_lines(self):
+        # without multi-line notes the table agrees with checking every header on every line
+        generator = random.Random(5)
+        for _ in range(500):
+            values = self.random_values(generator)
+            values[DBEntry.FIELD_NOTES] = values[DBEntry.FIELD_NOTES].split('\n')[0]
+            lines = self.show_lines(values)
+            expected = {}
+            for line in lines:
+                for field, header in DBEntry.FIELD_HEADERS.items():
+                    if DBEntry.extract_value(header, line) is not None:
+                        expected.setdefault(field, DBEntry.extract_value(header, line))
+            self.assertEqual(expected, DBEntry.parse_lines(lines))
+
+    def test_from_lines_keeps_multi_line_notes(self):
+        first = DBEntry.from_lines('p', ['Title: t', 'Notes: same first line', 'body one'], 'salt', Fingerprinter())
+        second = DBEntry.from_lines('p', ['Title: t', 'Notes: same first line', 'body two'], 'salt', Fingerprinter())
+        self.assertEqual('same first line\nbody one', first.notes)
+        self.assertNotEqual(first, second)
+
+    def test_from_lines_notes_swallow_headers(self):
+        lines = ['Title: t', 'URL: u', 'Notes: n', 'URL: not the url', 'Tags: x', 'Title: evil', 'Uuid: {1}']
+        entry = DBEntry.from_lines('p', lines, 'salt', trailing_headers=True)
+        self.assertEqual(('t', 'u'), (entry.title, entry.url))
+        self.assertEqual('n\nURL: not the url\nTags: x\nTitle: evil', entry.notes)
+        # 'show -a' prints nothing after the notes
+        entry = DBEntry.from_lines('p', lines, 'salt')
+        self.assertEqual(('t', 'n\nURL: not the url\nTags: x\nTitle: evil\nUuid: {1}'), (entry.title, entry.notes))
+
+    def test_from_attachment_lines(self):
+        lines = ['Title: t', 'UserName: jdoe', 'Notes: n1', 'n2', '', 'Attachments:', '  cert.pem (2.9 KiB)',
+                 '  key (ring).bin (12.0 B)']
+        entry = DBEntry.from_attachment_lines('g/t', lines, 'salt', None,
+                                              (DBEntry.FIELD_TITLE, DBEntry.FIELD_NOTES, DBEntry.FIELD_ATTACHMENTS))
+        self.assertEqual(('t', None, 'n1\nn2'), (entry.title, entry.user_name, entry.notes))
+        self.assertEqual({'cert.pem': '2.9 KiB', 'key (ring).bin': '12.0 B'}, entry.attachments)
+        self.assertIsNone(entry.custom_attributes)
+
+    def test_from_attachment_lines_without_attachments(self):
+        entry = DBEntry.from_attachment_lines('t', ['Title: t', 'Notes: ', '', 'No attachments present.'], 'salt',
+                                              None, (DBEntry.FIELD_TITLE, DBEntry.FIELD_ATTACHMENTS))
+        self.assertEqual({}, entry.attachments)
+
+    def test_from_strings(self):
+        fingerprinter = Fingerprinter()
+        strings = {'Title': 't', 'UserName': 'jdoe', 'Password': 'secret', 'URL': 'u', 'Notes': 'n1\r\nSee: n2',
+                   'API key': 'k1', 'recovery': 'c1\nc2'}
+        entry = DBEntry.from_strings('g/t', strings, 'salt', fingerprinter, DBEntry.FIELDS + DBEntry.EXTENDED_FIELDS)
+        self.assertEqual(('t', 'jdoe', fingerprinter.fingerprint('secret'), 'u', 'n1\nSee: n2'),
+                         (entry.title, entry.user_name, entry.password_hash, entry.url, entry.notes))
+        self.assertEqual({'API key': fingerprinter.fingerprint('k1'), 'recovery': fingerprinter.fingerprint('c1\nc2')},
+                         entry.custom_attributes)
+        entry = DBEntry.from_strings('g/t', strings, 'salt', None, (DBEntry.FIELD_TITLE,))
+        self.assertEqual(('t', None, None), (entry.title, entry.notes, entry.custom_attributes))
+
+    def test_show_attributes_extended(self):
+        self.assertEqual(['--show-attachments'], DBEntry.show_attributes((DBEntry.FIELD_ATTACHMENTS,)))
+        self.assertEqual(['--show-attachments'],
+                         DBEntry.show_attributes((DBEntry.FIELD_TITLE, DBEntry.FIELD_ATTACHMENTS)))
+
+    def test_extended_digest_and_is_same(self):
+        first = DBEntry('p', 't', custom_attributes={'a': '1', 'b': '2'}, attachments={'f': '1.0 B'})
+        second = DBEntry('p', 't', custom_attributes={'b': '2', 'a': '1'}, attachments={'f': '1.0 B'})
+        self.assertEqual(first.digest(DBEntry.EXTENDED_FIELDS), second.digest(DBEntry.EXTENDED_FIELDS))
+        self.assertEqual(first, second)
+        second.attachments = {'f': '2.0 B'}
+        second.custom_attributes = {'a': '1'}
+        self.assertNotEqual(first.digest(DBEntry.EXTENDED_FIELDS), second.digest(DBEntry.EXTENDED_FIELDS))
+        self.assertEqual(DBEntry.EXTENDED_FIELDS, tuple(first.differing_fields(second, DBEntry.EXTENDED_FIELDS)))
+        self.assertTrue(first.is_same(second, ignore_attributes=True, ignore_attachments=True))
+        self.assertFalse(first.is_same(second, ignore_attributes=True))
+
+    def test_fingerprinted_keeps_extended_fields(self):
+        entry = DBEntry('p', 't', custom_attributes={'a': 'fp'}, attachments={'f': '1.0 B'})
+        fingerprinted = entry.fingerprinted(Fingerprinter(), DBEntry.FIELDS + DBEntry.EXTENDED_FIELDS)
+        self.assertEqual({'a': 'fp'}, fingerprinted.custom_attributes)
+        self.assertEqual({'f': '1.0 B'}, fingerprinted.attachments)
+
     @parameterized.expand([
         [
             ['path', 'title', 'user_name', 'password', 'url', 'notes'],
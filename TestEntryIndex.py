@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import unittest
+import io
+import os
+import tempfile
+from unittest.mock import patch
+from parameterized import parameterized
+import fake_keepassxc_cli
+from fake_keepassxc_cli import FakeDatabase
+from diff_dbs import EntryIndex, SnapshotCache, DBEntry, PathFilter, read_database_indexed, diff_dbs, convert, \
+    BACKEND_EXPORT, BACKEND_SHOW, BACKEND_ASYNC
+
+
+class TestEntryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.index_dir = os.path.join(self.directory.name, 'index')
+        self.log = os.path.join(self.directory.name, 'processes.log')
+        self.database = os.path.join(self.directory.name, 'test.json')
+        self.entries = [
+            {'path': 'a', 'username': 'jdoe', 'password': 'hunter2', 'url': 'https://a', 'notes': 'nnn',
+             'last_modified': '2024-01-01T10:00:00Z'},
+            {'path': 'g/b', 'username': 'jdoe2', 'last_modified': '2024-01-02T10:00:00Z'},
+            {'path': 'g/c', 'username': 'jdoe3', 'last_modified': '2024-01-03T10:00:00Z'},
+        ]
+        FakeDatabase.save(self.database, 'pw', self.entries)
+        for patcher in (patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND),
+                        patch.dict(os.environ, {fake_keepassxc_cli.LOG_VARIABLE: self.log})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def read(self, backend=BACKEND_SHOW, path_filter=None):
+        if os.path.exists(self.log):
+            os.remove(self.log)
+        entries = read_database_indexed(EntryIndex(self.index_dir), self.database, 'pw', backend,
+                                        path_filter=path_filter)
+        with open(self.log, encoding='utf-8') as log_file:
+            return entries, [line.split()[0] for line in log_file]
+
+    def change(self, path, **values):
+        for entry in self.entries:
+            if entry['path'] == path:
+                entry.update(values)
+        FakeDatabase.save(self.database, 'pw', self.entries)
+
+    @parameterized.expand([(BACKEND_SHOW, ), (BACKEND_ASYNC, )])
+    def test_only_modified_entries_are_shown(self, backend):
+        first, commands = self.read(backend)
+        self.assertEqual(['export', 'ls', 'show', 'show', 'show'], commands)
+        second, commands = self.read(backend)
+        self.assertEqual(['export'], commands)
+        self.assertEqual(convert(first), convert(second))
+        self.change('g/b', username='changed', last_modified='2024-02-01T10:00:00Z')
+        third, commands = self.read(backend)
+        self.assertEqual(['export', 'ls', 'show'], commands)
+        index = EntryIndex(self.index_dir)
+        self.assertEqual(index.fingerprinter.fingerprint('changed'), convert(third)['g/b'].user_name)
+        self.assertEqual(['a', 'g/b', 'g/c'], [entry.path for entry in third])
+
+    def test_entries_without_timestamp_are_read_again(self):
+        self.change('a', last_modified='')
+        self.read()
+        _, commands = self.read()
+        self.assertEqual(['export', 'ls', 'show'], commands)
+
+    def test_export_backend(self):
+        first, _ = self.read(BACKEND_EXPORT)
+        self.change('a', notes='changed', last_modified='2024-02-01T10:00:00Z')
+        second, commands = self.read(BACKEND_EXPORT)
+        self.assertEqual(['export'], commands)
+        self.assertEqual([DBEntry.FIELD_NOTES], convert(first)['a'].differing_fields(convert(second)['a']))
+
+    def test_index_holds_fingerprints_only(self):
+        self.read()
+        with open(EntryIndex(self.index_dir).index_path(self.database), 'rb') as index_file:
+            content = SnapshotCache.decrypt(index_file.read(), 'pw')
+        for value in (b'jdoe', b'hunter2', b'https://a', b'nnn'):
+            self.assertNotIn(value, content)
+
+    def test_filtered_entries_stay_indexed(self):
+        self.read()
+        entries, _ = self.read(path_filter=PathFilter(['g/*']))
+        self.assertEqual(['g/b', 'g/c'], [entry.path for entry in entries])
+        _, commands = self.read()
+        self.assertEqual(['export'], commands)
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_command_line(self, mout):
+        second = os.path.join(self.directory.name, 'second.json')
+        FakeDatabase.save(second, 'pw2', self.entries[:2])
+        arguments = [self.database, 'pw', second, 'pw2', '--backend', 'show', '--index-dir', self.index_dir]
+        diff_dbs(arguments)
+        diff_dbs(arguments)
+        self.assertEqual(['new entry in %s:g/c' % self.database] * 2, mout.getvalue().splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import tempfile
+import threading
+from diff_dbs import FileWatcher
+
+
+class TestFileWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.first = self.write('first.kdbx', 'first')
+        self.second = self.write('second.kdbx', 'second')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as database_file:
+            database_file.write(content)
+        return path
+
+    def replace(self, path, content):
+        # the way KeePassXC saves a database
+        os.replace(self.write('.tmp', content), path)
+
+    def watcher(self, use_inotify):
+        watcher = FileWatcher([self.first, self.second], debounce=0.2, interval=0.01, use_inotify=use_inotify)
+        self.addCleanup(watcher.close)
+        if use_inotify and watcher.descriptor is None:
+            self.skipTest('inotify is not available')
+        return watcher
+
+    def test_polling(self):
+        watcher = self.watcher(False)
+        self.assertEqual(set(), watcher.wait(0.05))
+        self.write('second.kdbx', 'changed')
+        self.assertEqual({self.second}, watcher.wait(1))
+
+    def test_inotify(self):
+        watcher = self.watcher(True)
+        self.write('unrelated', 'content')
+        self.assertEqual(set(), watcher.wait(0.1))
+        self.replace(self.first, 'changed')
+        self.assertEqual({self.first}, watcher.wait(1))
+
+    def test_debounce(self):
+        for use_inotify in (False, True):
+            with self.subTest(use_inotify=use_inotify):
+                watcher = self.watcher(use_inotify)
+                writes = [threading.Timer(0.05, self.replace, (self.first, 'one')),
+                          threading.Timer(0.15, self.replace, (self.second, 'two'))]
+                for write in writes:
+                    write.start()
+                self.assertEqual({self.first, self.second}, next(watcher.changes()))
+                for write in writes:
+                    write.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
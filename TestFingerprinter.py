@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import unittest
+from diff_dbs import Fingerprinter
+
+
+class TestFingerprinter(unittest.TestCase):
+
+    def test_fingerprint_is_stable_for_one_key(self):
+        fingerprinter = Fingerprinter()
+        self.assertEqual(fingerprinter.fingerprint('abc'), fingerprinter.fingerprint('abc'))
+        self.assertNotEqual(fingerprinter.fingerprint('abc'), fingerprinter.fingerprint('abd'))
+
+    def test_fingerprint_depends_on_key(self):
+        self.assertNotEqual(Fingerprinter().fingerprint('abc'), Fingerprinter().fingerprint('abc'))
+
+    def test_fingerprint_known_key(self):
+        self.assertEqual('9074c817004a2e1473c29832ee011616e9e3dd9f99e8047ceda3609c3b9e4bc2daac6a83d070daa190ed9'
+                         '3314e85e6451a702c2bfd38b2a1b9407c81ff3b7861', Fingerprinter(b'b').fingerprint('a'))
+
+    def test_from_secret_is_reproducible(self):
+        self.assertEqual(Fingerprinter.from_secret('secret', 'salt').key,
+                         Fingerprinter.from_secret('secret', 'salt').key)
+        self.assertNotEqual(Fingerprinter.from_secret('secret', 'salt').key,
+                            Fingerprinter.from_secret('secret', 'pepper').key)
+        self.assertEqual(Fingerprinter.KEY_SIZE, len(Fingerprinter.from_secret('secret', 'salt').key))
+
+
+    def test_fingerprint_chunks(self):
+        fingerprinter = Fingerprinter()
+        self.assertEqual(fingerprinter.fingerprint('abcdef'), fingerprinter.fingerprint_chunks([b'ab', b'cde', b'f']))
+        self.assertEqual(fingerprinter.fingerprint(''), fingerprinter.fingerprint_chunks([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
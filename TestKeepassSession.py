@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import tempfile
+import subprocess
+import io
+import time
+from unittest.mock import patch
+import fake_keepassxc_cli
+from fake_keepassxc_cli import FakeDatabase
+from diff_dbs import KeepassSession, KEEPASS_LS, KEEPASS_SHOW
+
+
+class TestKeepassSession(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.directory.name, 'test.json')
+        FakeDatabase.save(self.database, 'pw', [
+            {'path': 'a', 'username': 'user', 'password': 'secret', 'url': 'https://a', 'notes': 'n1\nn2'},
+            {'path': 'g/with space', 'username': 'user2'},
+            {'path': 'g/h/"quoted"', 'url': 'https://q'},
+        ], name='test')
+        patcher = patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_quote(self):
+        self.assertEqual('abc', KeepassSession.quote('abc'))
+        self.assertEqual('"a b"', KeepassSession.quote('a b'))
+        self.assertEqual('""', KeepassSession.quote(''))
+        self.assertEqual(None, KeepassSession.quote('a"b'))
+
+    def test_ls(self):
+        with KeepassSession(self.database, 'pw') as session:
+            self.assertEqual(b'test> ', session.prompt)
+            self.assertEqual(['a', 'g/', 'g/with space', 'g/h/', 'g/h/"quoted"'], session.execute(KEEPASS_LS))
+
+    def test_show_multiple_commands(self):
+        with KeepassSession(self.database, 'pw') as session:
+            self.assertEqual(['Title: a', 'UserName: user', 'Password: secret', 'URL: https://a', 'Notes: n1',
+                              'n2'], session.execute(KEEPASS_SHOW + ['a']))
+            self.assertEqual('UserName: user2', session.execute(KEEPASS_SHOW + ['g/with space'])[1])
+            self.assertEqual('URL: https://q', session.execute(KEEPASS_SHOW + ['g/h/"quoted"'])[3])
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_empty_database(self, merr):
+        FakeDatabase.save(self.database, 'pw', [], name='test')
+        start = time.perf_counter()
+        with KeepassSession(self.database, 'pw') as session:
+            self.assertEqual([], session.execute(KEEPASS_LS))
+            self.assertEqual([], session.execute(KEEPASS_LS))
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual('', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_failed_command(self, merr):
+        with KeepassSession(self.database, 'pw') as session:
+            self.assertEqual(None, session.execute(KEEPASS_SHOW + ['missing']))
+            self.assertEqual(['Title: a'], session.execute(KEEPASS_SHOW + ['a'])[:1])
+        self.assertIn('Could not find entry', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_show_group(self, merr):
+        with KeepassSession(self.database, 'pw') as session:
+            self.assertEqual(None, session.execute(KEEPASS_SHOW + ['g/'], suppress_no_entries=True))
+            self.assertEqual(['Title: a'], session.execute(KEEPASS_SHOW + ['a'])[:1])
+        self.assertNotIn('command failed', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_errors_stay_with_their_command(self, merr):
+        # an error is written to stderr before the prompt, but it may be read after it
+        with KeepassSession(self.database, 'pw') as session:
+            for _ in range(50):
+                self.assertEqual(None, session.execute(KEEPASS_SHOW + ['missing'], suppress_no_entries=True))
+                self.assertEqual(['Title: a'], session.execute(KEEPASS_SHOW + ['a'])[:1])
+        self.assertEqual('', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_wrong_password(self, merr):
+        with self.assertRaises(subprocess.CalledProcessError):
+            with KeepassSession(self.database, 'wrong'):
+                pass
+        self.assertIn('Invalid credentials', merr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import unittest
+import random
+from diff_dbs import MerkleTree, DBEntry, convert, diff_tree, merge_diff
+
+
+class TestMerkleTree(unittest.TestCase):
+
+    def database(self, *entries):
+        return convert([DBEntry(path, path.rpartition('/')[2], user_name) for path, user_name in entries])
+
+    def test_members(self):
+        tree = MerkleTree(self.database(('a', 'u'), ('g/h/b', 'u'), ('g/c', 'u')))
+        self.assertEqual({'': (['a'], {'g'}), 'g': (['g/c'], {'g/h'}), 'g/h': (['g/h/b'], set())}, tree.members)
+        self.assertEqual({'', 'g', 'g/h'}, set(tree.groups))
+
+    def test_identical_trees(self):
+        first = MerkleTree(self.database(('a', 'u'), ('g/b', 'u')))
+        second = MerkleTree(self.database(('g/b', 'u'), ('a', 'u')))
+        self.assertEqual(first.groups, second.groups)
+
+    def test_change_propagates_to_ancestors_only(self):
+        first = MerkleTree(self.database(('a', 'u'), ('g/h/b', 'u'), ('k/c', 'u')))
+        second = MerkleTree(self.database(('a', 'u'), ('g/h/b', 'u2'), ('k/c', 'u')))
+        self.assertNotEqual(first.root, second.root)
+        self.assertNotEqual(first.groups['g'], second.groups['g'])
+        self.assertNotEqual(first.groups['g/h'], second.groups['g/h'])
+        self.assertEqual(first.groups['k'], second.groups['k'])
+
+    def test_moved_entry_changes_digest(self):
+        first = MerkleTree(self.database(('g/a', 'u'), ('h/b', 'u')))
+        second = MerkleTree(self.database(('g/b', 'u'), ('h/a', 'u')))
+        self.assertNotEqual(first.root, second.root)
+
+    def test_diff_tree_matches_merge_diff(self):
+        generator = random.Random(4)
+        paths = ['/'.join(generator.choice('abc') for _ in range(generator.randint(1, 4))) + str(index)
+                 for index in range(200)]
+        first = self.database(*[(path, generator.choice('uv')) for path in paths if generator.random() < 0.9])
+        second = self.database(*[(path, generator.choice('uv')) for path in paths if generator.random() < 0.9])
+        self.assertEqual(list(merge_diff(sorted(first.values(), key=lambda entry: entry.path),
+                                         sorted(second.values(), key=lambda entry: entry.path))),
+                         list(diff_tree(first, second)))
+
+    def test_diff_tree_identical(self):
+        first = self.database(('a', 'u'), ('g/b', 'u'))
+        self.assertEqual([], list(diff_tree(first, self.database(('a', 'u'), ('g/b', 'u')))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import unittest
+from diff_dbs import PathFilter
+
+
+class TestPathFilter(unittest.TestCase):
+
+    def test_everything(self):
+        self.assertTrue(PathFilter().matches('any/path'))
+
+    def test_glob_matches_whole_path(self):
+        path_filter = PathFilter(['/Infra/*'])
+        self.assertTrue(path_filter.matches('Infra/server'))
+        self.assertTrue(path_filter.matches('Infra/db/primary'))
+        self.assertFalse(path_filter.matches('Other/Infra/server'))
+        self.assertFalse(path_filter.matches('Infrastructure'))
+
+    def test_regex_matches_anywhere(self):
+        path_filter = PathFilter(['re:ser.er$'])
+        self.assertTrue(path_filter.matches('Infra/server'))
+        self.assertFalse(path_filter.matches('Infra/servers'))
+
+    def test_regex_anchored_at_root(self):
+        path_filter = PathFilter(['re:^/g', 're:(?i)^/H/'])
+        self.assertEqual(['g/a', 'h/b'], path_filter.filter(['g/a', 'x/g', 'h/b', 'x/h/c']))
+
+    def test_regex_inline_flags(self):
+        path_filter = PathFilter(['re:(?i)^G', 'a/*'])
+        self.assertEqual(['g/x', 'G/y', 'a/z'], path_filter.filter(['g/x', 'G/y', 'a/z', 'A/w', 'x/g']))
+
+    def test_several_patterns(self):
+        path_filter = PathFilter(['a/*', 'b/*'], ['*/secret', 're:^b/tmp'])
+        self.assertEqual(['a/x', 'b/y'], path_filter.filter(['a/x', 'b/y', 'c/z', 'a/secret', 'b/tmp1']))
+
+    def test_exclude_only(self):
+        self.assertEqual(['keep'], PathFilter(exclude=['drop*']).filter(['keep', 'drop', 'dropped']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import unittest
+import io
+import os
+import stat
+import tempfile
+from unittest.mock import patch
+import fake_keepassxc_cli
+from fake_keepassxc_cli import FakeDatabase
+from diff_dbs import SnapshotCache, DBEntry, read_database_cached, diff_dbs
+
+
+class TestSnapshotCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+        self.database = os.path.join(self.directory.name, 'test.json')
+        FakeDatabase.save(self.database, 'pw', [
+            {'path': 'a', 'username': 'jdoe', 'password': 'hunter2', 'url': 'https://a', 'notes': 'nnn'},
+            {'path': 'g/b', 'username': 'jdoe2'},
+        ])
+        patcher = patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_encrypt_decrypt(self):
+        data = SnapshotCache.encrypt(b'content', 'pw')
+        self.assertNotIn(b'content', data)
+        self.assertEqual(b'content', SnapshotCache.decrypt(data, 'pw'))
+
+    def test_decrypt_wrong_password(self):
+        self.assertEqual(None, SnapshotCache.decrypt(SnapshotCache.encrypt(b'content', 'pw'), 'wrong'))
+
+    def test_decrypt_tampered(self):
+        data = bytearray(SnapshotCache.encrypt(b'content', 'pw'))
+        data[-SnapshotCache.TAG_SIZE - 1] ^= 1
+        self.assertEqual(None, SnapshotCache.decrypt(bytes(data), 'pw'))
+
+    def test_key_is_kept(self):
+        first = SnapshotCache(self.cache_dir)
+        second = SnapshotCache(self.cache_dir)
+        self.assertEqual(first.fingerprinter.key, second.fingerprinter.key)
+        mode = os.stat(os.path.join(self.cache_dir, SnapshotCache.KEY_FILE)).st_mode
+        self.assertEqual(0o600, stat.S_IMODE(mode))
+
+    def test_snapshot_holds_fingerprints_only(self):
+        cache = SnapshotCache(self.cache_dir)
+        entries = read_database_cached(cache, self.database, 'pw')
+        self.assertEqual(cache.fingerprinter.fingerprint('jdoe'), entries[0].user_name)
+        with open(cache.snapshot_path(self.database), 'rb') as snapshot_file:
+            content = SnapshotCache.decrypt(snapshot_file.read(), 'pw')
+        for value in (b'jdoe', b'hunter2', b'https://a', b'nnn'):
+            self.assertNotIn(value, content)
+
+    def test_unchanged_database_is_not_read(self):
+        cache = SnapshotCache(self.cache_dir)
+        expected = read_database_cached(cache, self.database, 'pw')
+        with patch('diff_dbs.KEEPASS_CLI', ['false']):
+            entries = read_database_cached(SnapshotCache(self.cache_dir), self.database, 'pw')
+        self.assertEqual(expected, entries)
+
+    def test_changed_database_is_read(self):
+        cache = SnapshotCache(self.cache_dir)
+        read_database_cached(cache, self.database, 'pw')
+        FakeDatabase.save(self.database, 'pw', [{'path': 'c'}])
+        entries = read_database_cached(cache, self.database, 'pw')
+        self.assertEqual(['c'], [entry.path for entry in entries])
+
+    def test_more_fields_are_read(self):
+        cache = SnapshotCache(self.cache_dir)
+        read_database_cached(cache, self.database, 'pw', fields=(DBEntry.FIELD_TITLE, ))
+        self.assertEqual(None, cache.load(self.database, 'pw', SnapshotCache.identify(self.database),
+                                          DBEntry.FIELDS))
+        self.assertEqual(2, len(cache.load(self.database, 'pw', SnapshotCache.identify(self.database),
+                                           (DBEntry.FIELD_TITLE, ))))
+
+    def test_invalidate_and_clear(self):
+        cache = SnapshotCache(self.cache_dir)
+        identity = SnapshotCache.identify(self.database)
+        read_database_cached(cache, self.database, 'pw')
+        cache.invalidate(self.database)
+        self.assertEqual(None, cache.load(self.database, 'pw', identity, DBEntry.FIELDS))
+        read_database_cached(cache, self.database, 'pw')
+        cache.clear()
+        self.assertEqual([], cache.snapshots())
+
+    def test_evict_oldest(self):
+        cache = SnapshotCache(self.cache_dir)
+        cache.store('first', 'pw', [0, 0, ''], DBEntry.FIELDS, [DBEntry('a')])
+        os.utime(cache.snapshot_path('first'), (0, 0))
+        cache.max_size = os.path.getsize(cache.snapshot_path('first')) + 1
+        cache.store('second', 'pw', [0, 0, ''], DBEntry.FIELDS, [DBEntry('a')])
+        self.assertEqual([cache.snapshot_path('second')], cache.snapshots())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_diff_dbs_with_cache(self, mout):
+        other = os.path.join(self.directory.name, 'other.json')
+        FakeDatabase.save(other, 'pw2', [
+            {'path': 'a', 'username': 'jdoe', 'password': 'hunter2', 'url': 'https://a', 'notes': 'changed'},
+            {'path': 'g/b', 'username': 'jdoe2'},
+        ])
+        for _ in range(2):
+            diff_dbs([self.database, 'pw', other, 'pw2', '--cache-dir', self.cache_dir])
+        self.assertEqual(['%s:a and %s:a differ' % (self.database, other)] * 2, mout.getvalue().splitlines())
+        self.assertEqual(2, len(SnapshotCache(self.cache_dir).snapshots()))
+
+
+if __name__ == '__main__':
+    unittest.main()
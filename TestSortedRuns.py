@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import unittest
+import random
+from diff_dbs import SortedRuns, DBEntry, Fingerprinter, sort_entries
+
+
+class TestSortedRuns(unittest.TestCase):
+
+    def entries(self, count):
+        generator = random.Random(7)
+        return [DBEntry('g%d/e%d' % (generator.randint(0, 9), index), 'e%d' % index, 'u', 'hash', '', None)
+                for index in generator.sample(range(count), count)]
+
+    def test_in_memory(self):
+        entries = self.entries(50)
+        with SortedRuns(entries, run_size=100) as runs:
+            self.assertEqual([], runs.runs)
+            self.assertEqual(sorted(entry.path for entry in entries), [entry.path for entry in runs])
+
+    def test_spilled(self):
+        entries = self.entries(95)
+        with SortedRuns(entries, run_size=10) as runs:
+            self.assertEqual(9, len(runs.runs))
+            self.assertEqual(5, len(runs.last))
+            result = list(runs)
+        self.assertEqual(sorted(entry.path for entry in entries), [entry.path for entry in result])
+        expected = {entry.path: entry for entry in entries}
+        for entry in result:
+            self.assertEqual(expected[entry.path], entry)
+
+    def test_sort_entries_fingerprints(self):
+        fingerprinter = Fingerprinter()
+        with sort_entries([DBEntry('b', 'title'), DBEntry('a', 'other')], fingerprinter, run_size=1) as runs:
+            result = list(runs)
+        self.assertEqual(['a', 'b'], [entry.path for entry in result])
+        self.assertEqual(fingerprinter.fingerprint('title'), result[1].title)
+
+
+if __name__ == '__main__':
+    unittest.main()
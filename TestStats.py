@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import unittest
+import io
+from diff_dbs import Stats
+
+
+class TestStats(unittest.TestCase):
+
+    def test_disabled(self):
+        stats = Stats()
+        self.assertIsNone(stats.start())
+        stats.add_phase(Stats.PHASE_PARSE, stats.start())
+        stats.add_call('show', stats.start())
+        stats.add_subprocess('open')
+        report = stats.report()
+        self.assertEqual({}, report['phases'])
+        self.assertEqual({}, report['subprocesses'])
+        self.assertEqual({}, report['latencies'])
+
+    def test_phases(self):
+        stats = Stats()
+        stats.reset(enabled=True)
+        with stats.phase(Stats.PHASE_READ):
+            pass
+        stats.add_phase(Stats.PHASE_READ, stats.start())
+        stats.add_call('show', stats.start())
+        stats.add_call('show', stats.start(), subprocess_started=False)
+        stats.add_subprocess('open')
+        report = stats.report()
+        self.assertEqual(2, report['phases'][Stats.PHASE_READ]['calls'])
+        self.assertEqual({'open': 1, 'show': 1}, report['subprocesses'])
+        self.assertEqual(2, report['latencies']['show']['calls'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, Stats.percentile(values, 50))
+        self.assertEqual(99, Stats.percentile(values, 99))
+        self.assertEqual(100, Stats.percentile(values, 100))
+        self.assertEqual(7, Stats.percentile([7], 99))
+
+    def test_histogram(self):
+        histogram = Stats.histogram([0.0005, 0.001, 0.003, 10])
+        self.assertEqual(2, histogram['0.001'])
+        self.assertEqual(1, histogram['0.005'])
+        self.assertEqual(1, histogram['inf'])
+        self.assertEqual(len(Stats.BUCKETS), len(histogram))
+
+    def test_print_report(self):
+        stats = Stats()
+        stats.reset(enabled=True)
+        stats.latencies['show'] = [0.002, 0.001, 0.003]
+        stats.subprocesses['show'] = 3
+        output = io.StringIO()
+        stats.print_report(output)
+        lines = output.getvalue().splitlines()
+        self.assertIn('subprocesses: 3', lines)
+        self.assertIn('latency show: 3 calls, p50 2.0 ms, p90 3.0 ms, p99 3.0 ms, max 3.0 ms', lines)
+
+    def test_profiled_disabled(self):
+        stats = Stats()
+
+        def function():
+            pass
+        self.assertIs(function, stats.profiled(function))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,29 @@
 #!/usr/bin/env python3
 
 import unittest
+import asyncio
 import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
 from unittest.mock import patch
-from diff_dbs import diff_dbs
+from parameterized import parameterized
+try:
+    import yaml
+except ImportError:
+    yaml = None
+import fake_keepassxc_cli
+from fake_keepassxc_cli import FakeDatabase
+from diff_dbs import diff_dbs, diff_tree, diff_many, merge_diff, load_manifest, parse_export, parse_export_xml, \
+    read_database_content, diff_batch, diff_databases, parse_batch, detect_moves, convert, DBEntry, Fingerprinter, \
+    DiffResult, BACKENDS, PathFilter, AdaptiveLimit, Report, run_keepass_command_async, print_results, parse_args, \
+    main, BACKEND_ASYNC, \
+    KIND_ADDED, KIND_REMOVED, KIND_CHANGED, KIND_MOVED, KIND_RENAMED, EXIT_SAME, EXIT_DIFFERENT, EXIT_ERROR
+import diff_dbs as diff_dbs_module
 
 
 class TestDiffDbs(unittest.TestCase):
@@ -24,12 +44,26 @@ class TestDiffDbs(unittest.TestCase):
         self.assertEqual(exc.exception.code, 2)
         self.assertEqual(mout.getvalue(), '')
         lines = merr.getvalue().splitlines()
-        self.assertEqual(['usage: Test_diff_dbs.py [-h] [--ignore-new-in-first] [--ignore-new-in-second]',
-                          '                        [--ignore-title] [--ignore-username]',
-                          '                        [--ignore-password] [--ignore-url] [--ignore-notes]',
-                          '                        database1 password1 database2 password2',
-                          'Test_diff_dbs.py: error: the following arguments are required: database1, password1,'
-                          ' database2, password2'],
+        self.assertEqual(['usage: Test_diff_dbs.py [-h] [--compare DATABASE PASSWORD] [--batch BATCH]',
+                          '                        [--backend {export,session,show,async}] [--jobs JOBS]',
+                          '                        [--timeout TIMEOUT] [--retries RETRIES]',
+                          '                        [--cache-dir CACHE_DIR]',
+                          '                        [--cache-max-size CACHE_MAX_SIZE] [--cache-clear]',
+                          '                        [--index-dir INDEX_DIR] [--stream]',
+                          '                        [--run-size RUN_SIZE]',
+                          '                        [--write-manifest WRITE_MANIFEST]',
+                          '                        [--baseline BASELINE] [--manifest-key MANIFEST_KEY]',
+                          '                        [--format {text,jsonl,json}] [--stats]',
+                          '                        [--stats-json STATS_JSON] [--profile PROFILE]',
+                          '                        [--watch] [--watch-debounce WATCH_DEBOUNCE]',
+                          '                        [--watch-interval WATCH_INTERVAL] [--detect-moves]',
+                          '                        [--include INCLUDE] [--exclude EXCLUDE] [--attributes]',
+                          '                        [--attachments] [--ignore-new-in-first]',
+                          '                        [--ignore-new-in-second] [--ignore-title]',
+                          '                        [--ignore-username] [--ignore-password] [--ignore-url]',
+                          '                        [--ignore-notes]',
+                          '                        [database1] [password1] [database2] [password2]',
+                          'Test_diff_dbs.py: error: the following arguments are required: database1, password1'],
                          lines)
 
     @patch(STD_ERR, new_callable=io.StringIO)
@@ -40,16 +74,96 @@ class TestDiffDbs(unittest.TestCase):
         self.assertEqual(exc.exception.code, 0)
         self.assertEqual(merr.getvalue(), '')
         lines = mout.getvalue().splitlines()
-        self.assertEqual(['usage: Test_diff_dbs.py [-h] [--ignore-new-in-first] [--ignore-new-in-second]',
-                          '                        [--ignore-title] [--ignore-username]',
-                          '                        [--ignore-password] [--ignore-url] [--ignore-notes]',
-                          '                        database1 password1 database2 password2', '',
+        self.assertEqual(['usage: Test_diff_dbs.py [-h] [--compare DATABASE PASSWORD] [--batch BATCH]',
+                          '                        [--backend {export,session,show,async}] [--jobs JOBS]',
+                          '                        [--timeout TIMEOUT] [--retries RETRIES]',
+                          '                        [--cache-dir CACHE_DIR]',
+                          '                        [--cache-max-size CACHE_MAX_SIZE] [--cache-clear]',
+                          '                        [--index-dir INDEX_DIR] [--stream]',
+                          '                        [--run-size RUN_SIZE]',
+                          '                        [--write-manifest WRITE_MANIFEST]',
+                          '                        [--baseline BASELINE] [--manifest-key MANIFEST_KEY]',
+                          '                        [--format {text,jsonl,json}] [--stats]',
+                          '                        [--stats-json STATS_JSON] [--profile PROFILE]',
+                          '                        [--watch] [--watch-debounce WATCH_DEBOUNCE]',
+                          '                        [--watch-interval WATCH_INTERVAL] [--detect-moves]',
+                          '                        [--include INCLUDE] [--exclude EXCLUDE] [--attributes]',
+                          '                        [--attachments] [--ignore-new-in-first]',
+                          '                        [--ignore-new-in-second] [--ignore-title]',
+                          '                        [--ignore-username] [--ignore-password] [--ignore-url]',
+                          '                        [--ignore-notes]',
+                          '                        [database1] [password1] [database2] [password2]',
+                          '',
                           'positional arguments:',
                           '  database1             the first database to compare',
                           '  password1             the password of the first database',
                           '  database2             the second database to compare',
-                          '  password2             the password of the second database', '', 'optional arguments:',
-                          '  -h, --help            show this help message and exit', '  --ignore-new-in-first',
+                          '  password2             the password of the second database',
+                          '',
+                          'optional arguments:',
+                          '  -h, --help            show this help message and exit',
+                          '  --compare DATABASE PASSWORD',
+                          '                        another database to compare against the first one,',
+                          '                        prints a matrix of all differences',
+                          '  --batch BATCH         compare all database pairs listed in this JSON or YAML',
+                          '                        file',
+                          '  --backend {export,session,show,async}',
+                          '                        how entries are read from the databases (default:',
+                          '                        export)',
+                          '  --jobs JOBS           number of entries fetched in parallel per database,',
+                          '                        the most the async backend goes up to (default: 1)',
+                          '  --timeout TIMEOUT     seconds a keepassxc-cli call of the async backend may',
+                          '                        take (default: 60.0)',
+                          '  --retries RETRIES     how often the async backend starts a call that timed',
+                          '                        out again (default: 2)',
+                          '  --cache-dir CACHE_DIR',
+                          '                        keep encrypted snapshots of unchanged databases in',
+                          '                        this directory',
+                          '  --cache-max-size CACHE_MAX_SIZE',
+                          '                        maximum size of all snapshots in bytes (default:',
+                          '                        67108864)',
+                          '  --cache-clear         remove all snapshots before reading the databases',
+                          '  --index-dir INDEX_DIR',
+                          '                        keep an encrypted index of when every entry was',
+                          '                        modified in this directory, and only read entries',
+                          '                        modified since the last run',
+                          '  --stream              diff path-sorted entry streams with bounded memory',
+                          '  --run-size RUN_SIZE   entries sorted in memory before spilling to disk in',
+                          '                        stream mode (default: 10000)',
+                          '  --write-manifest WRITE_MANIFEST',
+                          '                        write a fingerprint manifest of the first database to',
+                          '                        this file',
+                          '  --baseline BASELINE   compare the first database against this fingerprint',
+                          '                        manifest',
+                          '  --manifest-key MANIFEST_KEY',
+                          '                        the secret the manifest fingerprints are keyed with',
+                          '  --format {text,jsonl,json}',
+                          '                        how differences are printed, jsonl writes one JSON',
+                          '                        object per difference as soon as it is found (default:',
+                          '                        text)',
+                          '  --stats               report timings, subprocess counts and command',
+                          '                        latencies on stderr',
+                          '  --stats-json STATS_JSON',
+                          '                        write the statistics as JSON to this file',
+                          '  --profile PROFILE     write a cProfile dump of the run to this file',
+                          '  --watch               keep running and report differences that appear or are',
+                          '                        resolved whenever one of the databases changes',
+                          '  --watch-debounce WATCH_DEBOUNCE',
+                          '                        seconds without further writes before a changed',
+                          '                        database is read (default: 1.0)',
+                          '  --watch-interval WATCH_INTERVAL',
+                          '                        seconds between checks where inotify is not available',
+                          '                        (default: 2.0)',
+                          '  --detect-moves        report entries that were moved to another group or',
+                          '                        renamed',
+                          '  --include INCLUDE     only compare entries whose path matches this glob, or',
+                          '                        this regular expression when prefixed with re:',
+                          '  --exclude EXCLUDE     do not compare entries whose path matches this glob,',
+                          '                        or this regular expression when prefixed with re:',
+                          '  --attributes          also compare custom attributes',
+                          '  --attachments         also compare attachments, by streaming digests of',
+                          '                        their content',
+                          '  --ignore-new-in-first',
                           '                        ignore new entries in the first database',
                           '  --ignore-new-in-second',
                           '                        ignore new entries in the second database',
@@ -67,6 +181,712 @@ class TestDiffDbs(unittest.TestCase):
         self.assertEqual(mout.getvalue(), '')
         self.assertEqual(merr.getvalue(), '')
 
+    def test_parse_export(self):
+        export = io.StringIO('"Group","Title","Username","Password","URL","Notes"\r\n'
+                             '"Root","a","user","pw","https://a","line1\nline2"\r\n'
+                             '"Root/g","b","","","",""\r\n', newline='')
+        entries = list(parse_export(export, 'salt', None))
+        self.assertEqual(['a', 'g/b'], [entry.path for entry in entries])
+        self.assertEqual('user', entries[0].user_name)
+        self.assertEqual(DBEntry.create_password_hash('pw', 'salt'), entries[0].password_hash)
+        self.assertEqual('line1\nline2', entries[0].notes)
+        self.assertEqual('', entries[1].user_name)
+
+    def test_parse_export_xml(self):
+        export = ('<KeePassFile><Root><Group><Name>Root</Name>'
+                  '<Entry><String><Key>Title</Key><Value>a</Value></String>'
+                  '<String><Key>Notes</Key><Value>line1\nkey: value</Value></String>'
+                  '<String><Key>key</Key><Value>secret</Value></String>'
+                  '<History><Entry><String><Key>Title</Key><Value>a</Value></String>'
+                  '<String><Key>old</Key><Value>x</Value></String></Entry></History></Entry>'
+                  '<Group><Name>g</Name><Entry><String><Key>Title</Key><Value>b</Value></String></Entry></Group>'
+                  '</Group></Root></KeePassFile>').encode()
+        chunks = [export[index:index + 16] for index in range(0, len(export), 16)]
+        entries = list(parse_export_xml(chunks, 'salt', None, DBEntry.FIELDS + (DBEntry.FIELD_CUSTOM_ATTRIBUTES,)))
+        self.assertEqual(['a', 'g/b'], [entry.path for entry in entries])
+        self.assertEqual('line1\nkey: value', entries[0].notes)
+        self.assertEqual({'key': 'secret'}, entries[0].custom_attributes)
+        self.assertEqual({}, entries[1].custom_attributes)
+
+    def test_parse_export_xml_lets_attachments_go(self):
+        output = io.StringIO()
+        FakeDatabase('test', [{'path': 'e%d' % index, 'attachments': {'blob': str(index) * 100000}}
+                              for index in range(30)]).export_xml(output)
+        export = output.getvalue().encode()
+        chunks = [export[index:index + 65536] for index in range(0, len(export), 65536)]
+        tracemalloc.start()
+        try:
+            entries = list(parse_export_xml(chunks, 'salt', None, (DBEntry.FIELD_TITLE,)))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(30, len(entries))
+        self.assertLess(peak, len(export) / 4)
+
+
+class TestReadDatabaseContent(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.database = os.path.join(self.directory.name, 'test.json')
+        FakeDatabase.save(self.database, 'pw', [
+            {'path': 'a', 'username': 'user', 'password': 'secret', 'url': 'https://a', 'notes': 'n1\nn2'},
+            {'path': 'g/with space', 'username': 'user2', 'password': 'p2', 'notes': 'n3\r\n'},
+            {'path': 'g/h/c', 'title': 'c', 'url': 'https://c'},
+        ], name='test', groups=['empty'])
+        patcher = patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @parameterized.expand([(backend, jobs) for backend in BACKENDS for jobs in (1, 4)])
+    def test_backends_read_the_same_entries(self, backend, jobs):
+        fingerprinter = Fingerprinter()
+        expected = [DBEntry('a', 'a', 'user', fingerprinter.fingerprint('secret'), 'https://a', 'n1\nn2'),
+                     DBEntry('g/with space', 'with space', 'user2', fingerprinter.fingerprint('p2'), '', 'n3\n'),
+                     DBEntry('g/h/c', 'c', '', fingerprinter.fingerprint(''), 'https://c', '')]
+        entries = read_database_content(self.database, 'pw', backend, jobs, fingerprinter)
+        self.assertEqual(convert(expected), convert(entries))
+
+    def test_xml_export_reads_the_same_entries(self):
+        fields = DBEntry.FIELDS + (DBEntry.FIELD_CUSTOM_ATTRIBUTES,)
+        fingerprinter = Fingerprinter()
+
+        def values(entries):
+            return [[entry.path] + [entry.field_value(field) for field in DBEntry.FIELDS] for entry in entries]
+
+        self.assertEqual(values(read_database_content(self.database, 'pw', 'show', fingerprinter=fingerprinter)),
+                         values(read_database_content(self.database, 'pw', fingerprinter=fingerprinter,
+                                                      fields=fields)))
+
+    @parameterized.expand([(backend, extended) for backend in BACKENDS for extended in (False, True)])
+    def test_notes_with_header_lines(self, backend, extended):
+        notes = 'first\nTags: prod\nTitle: evil'
+        FakeDatabase.save(self.database, 'pw', [{'path': 'a', 'username': 'user', 'notes': notes}])
+        fields = DBEntry.FIELDS + ((DBEntry.FIELD_ATTACHMENTS,) if extended else ())
+        entries = read_database_content(self.database, 'pw', backend, fields=fields)
+        self.assertEqual([('a', 'user', notes)], [(entry.title, entry.user_name, entry.notes) for entry in entries])
+
+    @parameterized.expand([(backend, ) for backend in BACKENDS])
+    def test_ignored_fields_are_not_read(self, backend):
+        fields = (DBEntry.FIELD_TITLE, DBEntry.FIELD_URL)
+        expected = [DBEntry('a', 'a', url='https://a'), DBEntry('g/with space', 'with space', url=''),
+                    DBEntry('g/h/c', 'c', url='https://c')]
+        entries = read_database_content(self.database, 'pw', backend, fields=fields)
+        self.assertEqual(convert(expected), convert(entries))
+
+    @parameterized.expand([(backend, ) for backend in BACKENDS])
+    def test_parallel_read_keeps_listing_order(self, backend):
+        entries = read_database_content(self.database, 'pw', backend, 8)
+        self.assertEqual(['a', 'g/with space', 'g/h/c'], [entry.path for entry in entries])
+
+    @parameterized.expand([(backend, ) for backend in BACKENDS])
+    def test_path_filter(self, backend):
+        path_filter = PathFilter(['/g/*'], ['re:with'])
+        with patch('diff_dbs.execute_keepass_command', wraps=diff_dbs_module.execute_keepass_command) as execute:
+            entries = read_database_content(self.database, 'pw', backend, path_filter=path_filter)
+        self.assertEqual(['g/h/c'], [entry.path for entry in entries])
+        shown = [call.args[0][-1] for call in execute.call_args_list if call.args[0][0] == 'show']
+        self.assertEqual(['g/h/c'] if backend == 'show' else [], shown)
+
+    def test_async_call_timeout(self):
+        log = os.path.join(self.directory.name, 'processes.log')
+        limit = AdaptiveLimit(4, 4)
+        with patch.dict(os.environ, {fake_keepassxc_cli.LATENCY_VARIABLE: '2',
+                                     fake_keepassxc_cli.LOG_VARIABLE: log}):
+            with self.assertRaises(subprocess.TimeoutExpired):
+                asyncio.run(run_keepass_command_async(['show', '-s', self.database, 'a'], 'pw', limit, 0.2, 1))
+        with open(log, encoding='utf-8') as log_file:
+            self.assertEqual(2, len(log_file.readlines()))
+        self.assertEqual(2, limit.limit)
+
+    @parameterized.expand([('missing entry', 'pw', 'missing', 4), ('failed', 'wrong', 'a', 2)])
+    def test_async_call_failure(self, _, password, path, expected):
+        limit = AdaptiveLimit(4, 4)
+        limit.since_decrease = 4
+        returncode, _, _ = asyncio.run(run_keepass_command_async(['show', '-s', self.database, path], password,
+                                                                 limit))
+        self.assertTrue(returncode)
+        self.assertEqual(expected, limit.limit)
+
+    def test_async_listing_timeout(self):
+        with patch.dict(os.environ, {fake_keepassxc_cli.LATENCY_VARIABLE: '2'}), \
+                self.assertRaises(subprocess.TimeoutExpired):
+            read_database_content(self.database, 'pw', BACKEND_ASYNC, timeout=0.2)
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_async_wrong_password(self, _):
+        with self.assertRaises(subprocess.CalledProcessError):
+            read_database_content(self.database, 'wrong', BACKEND_ASYNC)
+
+
+class TestDiffTree(unittest.TestCase):
+
+    def test_identical(self):
+        first = convert([DBEntry('a', 'a', 'u'), DBEntry('b', 'b', 'u')])
+        second = convert([DBEntry('b', 'b', 'u'), DBEntry('a', 'a', 'u')])
+        self.assertEqual([], list(diff_tree(first, second)))
+
+    def test_added_removed_changed(self):
+        first = convert([DBEntry('a', 'a', 'u'), DBEntry('c', 'c', 'u', url='x'), DBEntry('d', 'd')])
+        second = convert([DBEntry('b', 'b', 'u'), DBEntry('c', 'c', 'u2', url='y'), DBEntry('d', 'd')])
+        results = list(diff_tree(first, second))
+        self.assertEqual([DiffResult(KIND_REMOVED, 'a', first['a'], None, []),
+                          DiffResult(KIND_ADDED, 'b', None, second['b'], []),
+                          DiffResult(KIND_CHANGED, 'c', first['c'], second['c'],
+                                     [DBEntry.FIELD_USERNAME, DBEntry.FIELD_URL])],
+                         results)
+
+    def test_merge_diff_matches_diff_tree(self):
+        first = [DBEntry('a', 'a', 'u'), DBEntry('c', 'c', 'u', url='x'), DBEntry('d', 'd'), DBEntry('e', 'e')]
+        second = [DBEntry('b', 'b', 'u'), DBEntry('c', 'c', 'u2', url='y'), DBEntry('d', 'd'), DBEntry('f', 'f')]
+        self.assertEqual(list(diff_tree(convert(first), convert(second))), list(merge_diff(first, second)))
+
+    def test_merge_diff_last_duplicate_wins(self):
+        first = [DBEntry('a', 'a', 'u'), DBEntry('a', 'a', 'u2')]
+        second = [DBEntry('a', 'a', 'u2')]
+        self.assertEqual([], list(merge_diff(first, second)))
+
+    def test_ignored_fields(self):
+        first = convert([DBEntry('c', 'c', 'u', url='x')])
+        second = convert([DBEntry('c', 'c', 'u', url='y')])
+        self.assertEqual([], list(diff_tree(first, second, (DBEntry.FIELD_TITLE, DBEntry.FIELD_USERNAME))))
+
+    def test_detect_moves(self):
+        first = convert([DBEntry('g/a', 'a', 'u', 'p1'), DBEntry('b', 'b', 'u', 'p2'), DBEntry('c', 'c', 'u', 'p3'),
+                         DBEntry('e', 'e'), DBEntry('x', 'x', 'same'), DBEntry('y', 'y', 'same')])
+        second = convert([DBEntry('h/a', 'a', 'u', 'p1'), DBEntry('b2', 'b2', 'u', 'p2'), DBEntry('c', 'c', 'u', 'p4'),
+                          DBEntry('f', 'f'), DBEntry('z', 'z', 'same')])
+        results = detect_moves(diff_tree(first, second))
+        self.assertEqual([(KIND_RENAMED, 'b', 'b2', [DBEntry.FIELD_TITLE]),
+                          (KIND_CHANGED, 'c', 'c', [DBEntry.FIELD_PASSWORD]),
+                          (KIND_REMOVED, 'e', None, []),
+                          (KIND_ADDED, 'f', 'f', []),
+                          (KIND_MOVED, 'g/a', 'h/a', []),
+                          (KIND_RENAMED, 'x', 'z', [DBEntry.FIELD_TITLE]),
+                          (KIND_REMOVED, 'y', None, [])],
+                         [(result.kind, result.path, result.second and result.second.path, result.fields)
+                          for result in results])
+
+    def test_detect_moves_ignored_title(self):
+        first = convert([DBEntry('g/a', 'a', 'u')])
+        second = convert([DBEntry('h/b', 'b', 'u')])
+        self.assertEqual([KIND_RENAMED], [result.kind for result in
+                                          detect_moves(diff_tree(first, second, (DBEntry.FIELD_USERNAME,)),
+                                                       (DBEntry.FIELD_USERNAME,))])
+
+    def test_diff_many(self):
+        reference = convert([DBEntry('a', 'a', 'u'), DBEntry('c', 'c', 'u'), DBEntry('g/d', 'd')])
+        others = [convert([DBEntry('a', 'a', 'u'), DBEntry('c', 'c', 'u2'), DBEntry('g/d', 'd')]),
+                  convert([DBEntry('a', 'a', 'u'), DBEntry('c', 'c', 'u'), DBEntry('g/d', 'd')]),
+                  convert([DBEntry('a', 'a', 'u'), DBEntry('b', 'b'), DBEntry('c', 'c', 'u')])]
+        rows = list(diff_many(reference, iter(others)))
+        self.assertEqual(['b', 'c', 'g/d'], [path for path, _ in rows])
+        self.assertEqual([None, None, DiffResult(KIND_ADDED, 'b', None, others[2]['b'], [])], rows[0][1])
+        self.assertEqual([KIND_CHANGED, None, None], [result and result.kind for result in rows[1][1]])
+        self.assertEqual([None, None, KIND_REMOVED], [result and result.kind for result in rows[2][1]])
+        for index, other in enumerate(others):
+            pair = [results[index] for _, results in rows if results[index] is not None]
+            self.assertEqual(list(diff_tree(reference, other)), pair)
+
+
+class TestDiffDbsFake(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.first = os.path.join(self.directory.name, 'first.json')
+        self.second = os.path.join(self.directory.name, 'second.json')
+        FakeDatabase.save(self.first, 'pw1', [
+            {'path': 'a', 'username': 'user', 'password': 'secret'},
+            {'path': 'g/b', 'username': 'user', 'url': 'https://b'},
+            {'path': 'g/only_first'},
+        ])
+        FakeDatabase.save(self.second, 'pw2', [
+            {'path': 'a', 'username': 'user', 'password': 'changed'},
+            {'path': 'g/b', 'username': 'user', 'url': 'https://b'},
+            {'path': 'only_second'},
+        ])
+        patcher = patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_differences(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2'])
+        self.assertEqual(['%s:a and %s:a differ' % (self.first, self.second),
+                          'new entry in %s:g/only_first' % self.first,
+                          'new entry in %s:only_second' % self.second],
+                         mout.getvalue().splitlines())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_jsonl(self, mout):
+        self.assertEqual(EXIT_DIFFERENT, diff_dbs([self.first, 'pw1', self.second, 'pw2', '--format', 'jsonl']))
+        self.assertEqual([{'kind': KIND_CHANGED, 'path': 'a', 'first': self.first, 'second': self.second,
+                           'fields': [DBEntry.FIELD_PASSWORD]},
+                          {'kind': KIND_REMOVED, 'path': 'g/only_first', 'first': self.first, 'second': self.second,
+                           'fields': []},
+                          {'kind': KIND_ADDED, 'path': 'only_second', 'first': self.first, 'second': self.second,
+                           'fields': []}],
+                         [json.loads(line) for line in mout.getvalue().splitlines()])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_jsonl_is_written_as_found(self, mout):
+        args = parse_args([self.first, 'pw1', self.second, 'pw2', '--format', 'jsonl'])
+        written = []
+
+        def results():
+            for path in ('a', 'b'):
+                written.append(len(mout.getvalue().splitlines()))
+                yield DiffResult(KIND_ADDED, path, None, DBEntry(path), [])
+
+        print_results(Report(args.format), args, self.second, results())
+        self.assertEqual([0, 1], written)
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_json(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--format', 'json', '--ignore-new-in-first',
+                  '--ignore-new-in-second', '--detect-moves'])
+        self.assertEqual({'differences': [{'kind': KIND_CHANGED, 'path': 'a', 'first': self.first,
+                                           'second': self.second, 'fields': [DBEntry.FIELD_PASSWORD]}]},
+                         json.loads(mout.getvalue()))
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_json_moved(self, mout):
+        FakeDatabase.save(self.second, 'pw2', [
+            {'path': 'h/a', 'username': 'user', 'password': 'secret'},
+            {'path': 'g/b', 'username': 'user', 'url': 'https://b'},
+            {'path': 'g/only_first'},
+        ])
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--format', 'json', '--detect-moves'])
+        self.assertEqual([{'kind': KIND_MOVED, 'path': 'a', 'first': self.first, 'second': self.second,
+                           'fields': [], 'new_path': 'h/a'}],
+                         json.loads(mout.getvalue())['differences'])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_compare_many_jsonl(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--compare', self.first, 'pw1', '--format', 'jsonl'])
+        self.assertEqual([(KIND_CHANGED, 'a', self.second), (KIND_REMOVED, 'g/only_first', self.second),
+                          (KIND_ADDED, 'only_second', self.second)],
+                         [(record['kind'], record['path'], record['second'])
+                          for record in map(json.loads, mout.getvalue().splitlines())])
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_exit_codes(self, mout, merr):
+        self.assertEqual(EXIT_SAME, main([self.first, 'pw1', self.first, 'pw1']))
+        self.assertEqual(EXIT_DIFFERENT, main([self.first, 'pw1', self.second, 'pw2']))
+        self.assertEqual(EXIT_SAME, main([self.first, 'pw1', self.second, 'pw2', '--ignore-password',
+                                          '--ignore-new-in-first', '--ignore-new-in-second']))
+        mout.seek(0)
+        mout.truncate()
+        self.assertEqual(EXIT_ERROR, main([self.first, 'wrong', self.second, 'pw2', '--format', 'jsonl']))
+        self.assertEqual('', mout.getvalue())
+        self.assertIn('Invalid credentials', merr.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_stream(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--stream', '--run-size', '1'])
+        self.assertEqual(['%s:a and %s:a differ' % (self.first, self.second),
+                          'new entry in %s:g/only_first' % self.first,
+                          'new entry in %s:only_second' % self.second],
+                         mout.getvalue().splitlines())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_ignore_options(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--ignore-password', '--ignore-new-in-first',
+                  '--ignore-new-in-second'])
+        self.assertEqual('', mout.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_the_same(self, mout):
+        diff_dbs([self.first, 'pw1', self.first, 'pw1', '--backend', 'session'])
+        self.assertEqual('', mout.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_detect_moves(self, mout):
+        FakeDatabase.save(self.second, 'pw2', [
+            {'path': 'h/a', 'username': 'user', 'password': 'secret'},
+            {'path': 'g/b2', 'username': 'user', 'url': 'https://b'},
+            {'path': 'only_second'},
+        ])
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--detect-moves'])
+        self.assertEqual(['%s:a moved to %s:h/a' % (self.first, self.second),
+                          '%s:g/b renamed to %s:g/b2' % (self.first, self.second),
+                          'new entry in %s:g/only_first' % self.first,
+                          'new entry in %s:only_second' % self.second],
+                         mout.getvalue().splitlines())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_watch(self, mout):
+        def changes(_):
+            FakeDatabase.save(self.second, 'pw2', [
+                {'path': 'a', 'username': 'user', 'password': 'secret'},
+                {'path': 'g/b', 'username': 'user', 'url': 'https://changed'},
+                {'path': 'only_second'},
+            ])
+            yield {self.second}
+            yield {self.first}
+
+        with patch.object(diff_dbs_module.FileWatcher, 'changes', changes), \
+                patch('diff_dbs.iter_database_content', wraps=diff_dbs_module.iter_database_content) as read:
+            diff_dbs([self.first, 'pw1', self.second, 'pw2', '--watch'])
+        self.assertEqual(['%s:a and %s:a differ' % (self.first, self.second),
+                          'new entry in %s:g/only_first' % self.first,
+                          'new entry in %s:only_second' % self.second,
+                          'resolved: %s:a and %s:a differ' % (self.first, self.second),
+                          '%s:g/b and %s:g/b differ' % (self.first, self.second)],
+                         mout.getvalue().splitlines())
+        self.assertEqual([self.first, self.second, self.second, self.first],
+                         [call.args[0] for call in read.call_args_list])
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_watch_with_compare(self, merr):
+        with self.assertRaises(SystemExit):
+            diff_dbs([self.first, 'pw1', self.second, 'pw2', '--watch', '--compare', self.first, 'pw1'])
+        self.assertIn('--watch cannot be combined', merr.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_include_exclude(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--include', 'g/*', '--include', 'a'])
+        self.assertEqual(['%s:a and %s:a differ' % (self.first, self.second),
+                          'new entry in %s:g/only_first' % self.first],
+                         mout.getvalue().splitlines())
+        mout.seek(0)
+        mout.truncate()
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--exclude', 're:^(a|g/)'])
+        self.assertEqual(['new entry in %s:only_second' % self.second], mout.getvalue().splitlines())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_invalid_pattern(self, merr):
+        with self.assertRaises(SystemExit):
+            diff_dbs([self.first, 'pw1', self.second, 'pw2', '--include', 're:('])
+        self.assertIn('invalid path pattern', merr.getvalue())
+
+    def save_extended(self, first_attachment, second_attachment):
+        FakeDatabase.save(self.first, 'pw1', [
+            {'path': 'a', 'attributes': {'token': 't1'}, 'attachments': {'key': first_attachment}},
+            {'path': 'b', 'attributes': {'token': 't2'}, 'attachments': {'key': 'x' * 100}},
+        ])
+        FakeDatabase.save(self.second, 'pw2', [
+            {'path': 'a', 'attributes': {'token': 't1'}, 'attachments': {'key': second_attachment}},
+            {'path': 'b', 'attributes': {'token': 'changed'}, 'attachments': {'key': 'x' * 100}},
+        ])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_attributes(self, mout):
+        self.save_extended('same', 'same')
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--attributes'])
+        self.assertEqual(['%s:b and %s:b differ' % (self.first, self.second)], mout.getvalue().splitlines())
+        mout.seek(0)
+        mout.truncate()
+        diff_dbs([self.first, 'pw1', self.second, 'pw2'])
+        self.assertEqual('', mout.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_attributes_notes_look_like_attributes(self, mout):
+        FakeDatabase.save(self.first, 'pw1', [{'path': 'a', 'notes': 'intro\nSee also: wiki/old'}])
+        FakeDatabase.save(self.second, 'pw2', [{'path': 'a', 'notes': 'intro\nSee also: wiki/new'}])
+        self.assertEqual(EXIT_SAME,
+                         diff_dbs([self.first, 'pw1', self.second, 'pw2', '--attributes', '--ignore-notes']))
+        self.assertEqual('', mout.getvalue())
+        self.assertEqual(EXIT_DIFFERENT, diff_dbs([self.first, 'pw1', self.second, 'pw2', '--attributes']))
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_attributes_and_attachments(self, mout):
+        self.save_extended('same', 'diff')
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--attributes', '--attachments', '--backend', 'show'])
+        self.assertEqual(['%s:%s and %s:%s differ' % (self.first, path, self.second, path) for path in ('a', 'b')],
+                         mout.getvalue().splitlines())
+
+    @parameterized.expand([('same', 'same', []), ('same', 'diff', ['a']), ('short', 'longer', ['a'])])
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_attachments(self, first_attachment, second_attachment, expected, mout):
+        self.save_extended(first_attachment, second_attachment)
+        with patch('diff_dbs.ATTACHMENT_CHUNK_SIZE', 7), \
+                patch('diff_dbs.attachment_digest', wraps=diff_dbs_module.attachment_digest) as digest:
+            diff_dbs([self.first, 'pw1', self.second, 'pw2', '--attachments', '--jobs', '2'])
+        self.assertEqual(['%s:%s and %s:%s differ' % (self.first, path, self.second, path) for path in expected],
+                         mout.getvalue().splitlines())
+        # attachments of different sizes are never streamed
+        streamed = sorted(call.args[2] for call in digest.call_args_list)
+        self.assertEqual(['a', 'a', 'b', 'b'] if len(first_attachment) == len(second_attachment) else ['b', 'b'],
+                         streamed)
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_attachments_not_streamed(self, merr):
+        with self.assertRaises(SystemExit):
+            diff_dbs([self.first, 'pw1', self.second, 'pw2', '--attachments', '--stream'])
+        self.assertIn('--attachments cannot be combined', merr.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_compare_many(self, mout):
+        third = os.path.join(self.directory.name, 'third.json')
+        FakeDatabase.save(third, 'pw3', [
+            {'path': 'a', 'username': 'user', 'password': 'secret'},
+            {'path': 'g/b', 'username': 'other', 'url': 'https://c'},
+        ])
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--compare', third, 'pw3', '--compare', self.first, 'pw1'])
+        self.assertEqual(['\t'.join([self.first, self.second, third, self.first]),
+                          'a\tdiffers:password\tsame\tsame',
+                          'g/b\tsame\tdiffers:username,url\tsame',
+                          'g/only_first\tmissing\tmissing\tsame',
+                          'only_second\tnew\t-\t-'],
+                         mout.getvalue().splitlines())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_compare_many_ignore_new(self, mout):
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--compare', self.first, 'pw1', '--ignore-new-in-first',
+                  '--ignore-new-in-second'])
+        self.assertEqual(['\t'.join([self.first, self.second, self.first]), 'a\tdiffers:password\tsame'],
+                         mout.getvalue().splitlines())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_compare_many_identical(self, mout):
+        self.assertEqual(EXIT_SAME, diff_dbs([self.first, 'pw1', self.first, 'pw1', '--compare', self.first, 'pw1']))
+        self.assertEqual('', mout.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_compare_many_not_streamed(self, merr):
+        with self.assertRaises(SystemExit):
+            diff_dbs([self.first, 'pw1', self.second, 'pw2', '--compare', self.first, 'pw1', '--stream'])
+        self.assertIn('--compare cannot be combined', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_stats(self, mout, merr):
+        report = os.path.join(self.directory.name, 'stats.json')
+        profile = os.path.join(self.directory.name, 'profile')
+        diff_dbs([self.first, 'pw1', self.second, 'pw2', '--backend', 'show', '--jobs', '2', '--stats',
+                  '--stats-json', report, '--profile', profile])
+        self.assertEqual(3, len(mout.getvalue().splitlines()))
+        lines = merr.getvalue().splitlines()
+        self.assertIn('subprocesses: 10', lines)
+        self.assertIn('subprocesses ls: 2', lines)
+        self.assertTrue(any(line.startswith('latency show: 8 calls, p50 ') for line in lines))
+        with open(report) as report_file:
+            stats = json.load(report_file)
+        self.assertEqual({'compare', 'hash', 'parse', 'read'}, set(stats['phases']))
+        self.assertEqual(2, stats['phases']['read']['calls'])
+        self.assertEqual(8, sum(stats['latencies']['show']['histogram'].values()))
+        self.assertGreater(os.path.getsize(profile), 0)
+
+
+class TestBaseline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.database = os.path.join(self.directory.name, 'test.json')
+        self.manifest = os.path.join(self.directory.name, 'manifest.json')
+        FakeDatabase.save(self.database, 'pw', [
+            {'path': 'a', 'username': 'jdoe', 'password': 'hunter2', 'url': 'https://a', 'notes': 'nnn'},
+            {'path': 'g/b', 'username': 'jdoe2'},
+        ])
+        patcher = patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        diff_dbs([self.database, 'pw', '--write-manifest', self.manifest, '--manifest-key', 'key'])
+
+    def test_manifest_holds_no_secrets(self):
+        with open(self.manifest, encoding='utf-8') as manifest_file:
+            content = manifest_file.read()
+        for value in ('jdoe', 'hunter2', 'https://a', 'nnn'):
+            self.assertNotIn(value, content)
+        manifest = load_manifest(self.manifest)
+        self.assertEqual(DBEntry.FIELDS, manifest.fields)
+        self.assertEqual(['a', 'g/b'], [entry.path for entry in manifest.entries])
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_unchanged(self, mout):
+        diff_dbs([self.database, 'pw', '--baseline', self.manifest, '--manifest-key', 'key'])
+        self.assertEqual('', mout.getvalue())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_drift(self, mout):
+        FakeDatabase.save(self.database, 'pw', [
+            {'path': 'a', 'username': 'jdoe', 'password': 'changed', 'url': 'https://a', 'notes': 'nnn'},
+            {'path': 'c'},
+        ])
+        diff_dbs([self.database, 'pw', '--baseline', self.manifest, '--manifest-key', 'key'])
+        self.assertEqual(['%s:a and %s:a differ' % (self.database, self.manifest),
+                          'new entry in %s:c' % self.database,
+                          'new entry in %s:g/b' % self.manifest],
+                         mout.getvalue().splitlines())
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_wrong_key(self, mout):
+        diff_dbs([self.database, 'pw', '--baseline', self.manifest, '--manifest-key', 'other'])
+        self.assertEqual(2, len(mout.getvalue().splitlines()))
+
+    def test_missing_fields(self):
+        diff_dbs([self.database, 'pw', '--write-manifest', self.manifest, '--manifest-key', 'key',
+                  '--ignore-notes'])
+        with self.assertRaises(ValueError):
+            diff_dbs([self.database, 'pw', '--baseline', self.manifest, '--manifest-key', 'key'])
+
+    @parameterized.expand([
+        ('not a mapping', []),
+        ('no salt', {'version': 1, 'fields': ['title'], 'entries': []}),
+        ('unknown field', {'version': 1, 'salt': 's', 'fields': ['colour'], 'entries': []}),
+        ('short entry', {'version': 1, 'salt': 's', 'fields': ['title', 'url'], 'entries': [['a', 't']]}),
+    ])
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_malformed_manifest(self, _, content, merr):
+        with open(self.manifest, 'w', encoding='utf-8') as manifest_file:
+            json.dump(content, manifest_file)
+        with self.assertRaises(ValueError):
+            load_manifest(self.manifest)
+        self.assertEqual(EXIT_ERROR, main([self.database, 'pw', '--baseline', self.manifest, '--manifest-key', 'key']))
+        self.assertIn('error: ', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_manifest_key_required(self, merr):
+        with self.assertRaises(SystemExit) as exc:
+            diff_dbs([self.database, 'pw', '--baseline', self.manifest])
+        self.assertEqual(exc.exception.code, 2)
+        self.assertIn('--manifest-key is required', merr.getvalue())
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.master = os.path.join(self.directory.name, 'master.json')
+        self.first = os.path.join(self.directory.name, 'first.json')
+        self.second = os.path.join(self.directory.name, 'second.json')
+        FakeDatabase.save(self.master, 'pw', [
+            {'path': 'a', 'username': 'user', 'password': 'secret'},
+            {'path': 'g/b', 'url': 'https://b'},
+        ])
+        FakeDatabase.save(self.first, 'pw1', [
+            {'path': 'a', 'username': 'user', 'password': 'changed'},
+            {'path': 'g/b', 'url': 'https://b'},
+            {'path': 'c'},
+        ])
+        FakeDatabase.save(self.second, 'pw2', [
+            {'path': 'a', 'username': 'user2', 'password': 'secret'},
+        ])
+        self.batch = {'databases': {self.master: 'pw', self.first: 'pw1', self.second: 'pw2'},
+                      'pairs': [{'first': self.master, 'second': self.first},
+                                {'first': self.master, 'second': self.second, 'ignore': ['username'],
+                                 'ignore_new_in_first': True}]}
+        patcher = patch('diff_dbs.KEEPASS_CLI', fake_keepassxc_cli.COMMAND)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected(self):
+        return ['%s:a and %s:a differ' % (self.master, self.first),
+                'new entry in %s:c' % self.first]
+
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_json(self, mout):
+        path = os.path.join(self.directory.name, 'batch.json')
+        with open(path, 'w', encoding='utf-8') as batch_file:
+            json.dump(self.batch, batch_file)
+        diff_dbs(['--batch', path])
+        self.assertEqual(self.expected(), mout.getvalue().splitlines())
+
+    @unittest.skipIf(yaml is None, 'PyYAML is not installed')
+    @patch('sys.stdout', new_callable=io.StringIO)
+    def test_yaml(self, mout):
+        path = os.path.join(self.directory.name, 'batch.yaml')
+        with open(path, 'w', encoding='utf-8') as batch_file:
+            yaml.safe_dump(self.batch, batch_file)
+        diff_dbs(['--batch', path])
+        self.assertEqual(self.expected(), mout.getvalue().splitlines())
+
+    def test_databases_read_once(self):
+        with patch('diff_dbs.read_database_content', wraps=read_database_content) as read:
+            results = [(pair.second, [result.path for result in pair_results])
+                       for pair, pair_results in diff_batch(parse_batch(self.batch), read=read)]
+        self.assertEqual([(self.first, ['a', 'c']), (self.second, ['g/b'])], results)
+        self.assertEqual(sorted([self.master, self.first, self.second]),
+                         sorted(call.args[0] for call in read.call_args_list))
+        fields = {call.args[0]: call.kwargs['fields'] for call in read.call_args_list}
+        self.assertEqual(DBEntry.FIELDS, fields[self.master])
+        self.assertNotIn(DBEntry.FIELD_USERNAME, fields[self.second])
+
+    def test_reads_bounded_and_in_pair_order(self):
+        databases = ['d%d' % index for index in range(6)]
+        batch = parse_batch({'databases': {database: 'pw' for database in databases},
+                             'pairs': [{'first': 'd0', 'second': database} for database in databases[1:]]})
+        lock = threading.Lock()
+        running = []
+        started = []
+        most = []
+
+        def read(database, *_, **__):
+            with lock:
+                started.append(database)
+                running.append(database)
+                most.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(database)
+            return [DBEntry('a', 'a', database)]
+
+        results = diff_batch(batch, read=read, readers=2)
+        next(results)
+        self.assertEqual(databases[:4], sorted(started))
+        list(results)
+        self.assertEqual(databases, sorted(started))
+        self.assertLessEqual(max(most), 2)
+
+    @parameterized.expand([
+        ('list', []),
+        ('passwords', {'databases': ['a'], 'pairs': []}),
+        ('pairs', {'databases': {'a': 'pw'}, 'pairs': {'first': 'a'}}),
+        ('pair', {'databases': {'a': 'pw'}, 'pairs': ['a']}),
+        ('ignore', {'databases': {'a': 'pw'}, 'pairs': [{'first': 'a', 'second': 'a', 'ignore': 'url'}]}),
+        ('number password', {'databases': {'a': 1234}, 'pairs': []}),
+    ])
+    def test_parse_batch_malformed(self, _, content):
+        with self.assertRaises(ValueError):
+            parse_batch(content)
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_malformed_batch_file(self, merr):
+        path = os.path.join(self.directory.name, 'batch.json')
+        with open(path, 'w', encoding='utf-8') as batch_file:
+            json.dump([self.batch], batch_file)
+        self.assertEqual(EXIT_ERROR, main(['--batch', path]))
+        self.assertIn('error: ', merr.getvalue())
+
+    @unittest.skipIf(yaml is None, 'PyYAML is not installed')
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_invalid_yaml(self, merr):
+        path = os.path.join(self.directory.name, 'batch.yaml')
+        with open(path, 'w', encoding='utf-8') as batch_file:
+            batch_file.write('databases: [unclosed\n')
+        self.assertEqual(EXIT_ERROR, main(['--batch', path]))
+        self.assertIn('error: invalid YAML', merr.getvalue())
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_unexpected_error(self, merr):
+        with patch('diff_dbs.run_diff', side_effect=RuntimeError('boom')):
+            self.assertEqual(EXIT_ERROR, main(['--batch', 'any.json']))
+        self.assertIn('RuntimeError: boom', merr.getvalue())
+
+    def test_parse_batch_errors(self):
+        with self.assertRaises(ValueError):
+            parse_batch({'databases': {self.master: 'pw'}, 'pairs': [{'first': self.master, 'second': self.first}]})
+        with self.assertRaises(ValueError):
+            parse_batch({'databases': {self.master: 'pw'},
+                         'pairs': [{'first': self.master, 'second': self.master, 'ignore': ['colour']}]})
+
+    def test_diff_databases(self):
+        results = list(diff_databases(self.master, 'pw', self.first, 'pw1'))
+        self.assertEqual([(KIND_CHANGED, 'a', [DBEntry.FIELD_PASSWORD]), (KIND_ADDED, 'c', [])],
+                         [(result.kind, result.path, result.fields) for result in results])
+
+    @patch('sys.stderr', new_callable=io.StringIO)
+    def test_batch_without_databases(self, merr):
+        with self.assertRaises(SystemExit):
+            diff_dbs(['--batch', 'batch.json', self.master, 'pw'])
+        self.assertIn('--batch cannot be combined', merr.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main()
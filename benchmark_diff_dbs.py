@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import random
+import secrets
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import diff_dbs
+import fake_keepassxc_cli
+from diff_dbs import CompactEntry, DBEntry, Fingerprinter, BACKENDS, BACKEND_EXPORT
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CASE_READ = 'read'
+CASE_DIFF = 'diff'
+CASES = [CASE_READ, CASE_DIFF]
+SIZES = [100, 1000, 10000, 100000]
+PASSWORD = 'benchmark'
+CHANGED_FRACTION = 0.01
+GROUP_FANOUT = 8
+HASH_FUNCTIONS = [(Fingerprinter, 'fingerprint'), (DBEntry, 'create_password_hash'), (DBEntry, 'digest'),
+                  (CompactEntry, 'field_digest'), (CompactEntry, 'digest')]
+
+
+def time_per_call(function, values):
+    start = time.perf_counter()
+    for value in values:
+        function(value)
+    return (time.perf_counter() - start) / len(values)
+
+
+def benchmark_password_hash(entries):
+    passwords = [secrets.token_urlsafe(16) for _ in range(entries)]
+    fingerprinter = Fingerprinter()
+    return [('pbkdf2', time_per_call(DBEntry.create_password_hash, passwords)),
+            ('fingerprint', time_per_call(fingerprinter.fingerprint, passwords))]
+
+
+def parse_with_prefix_checks(lines):
+    # the parser DBEntry.parse_lines replaced, every header is checked on every line
+    values = {}
+    for line in lines:
+        for field, header in DBEntry.FIELD_HEADERS.items():
+            value = DBEntry.extract_value(header, line)
+            if value is not None:
+                values[field] = value
+    return values
+
+
+def show_output(entry):
+    return ['Title: ' + entry['title'], 'UserName: ' + entry['username'], 'Password: ' + entry['password'],
+            'URL: ' + entry['url']] + ('Notes: ' + entry['notes']).split('\n')
+
+
+def benchmark_parser(entries):
+    outputs = [show_output(entry) for entry in generate_entries(entries, notes_length=200)]
+    return [('prefix checks', time_per_call(parse_with_prefix_checks, outputs)),
+            ('dispatch table', time_per_call(DBEntry.parse_lines, outputs))]
+
+
+def bytes_per_entry(create, count):
+    tracemalloc.start()
+    try:
+        created = create()
+        return tracemalloc.get_traced_memory()[0] / count, created
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_memory(entries):
+    # entries are parsed the way they are read, so no value is shared with the generated ones
+    outputs = [(entry['path'], show_output(entry)) for entry in generate_entries(entries, notes_length=200)]
+    fingerprinter = Fingerprinter()
+
+    def full():
+        parsed = [DBEntry.from_lines(path, lines, 'salt', fingerprinter) for path, lines in outputs]
+        for entry in parsed:
+            entry.password_hash
+        return parsed
+
+    def paths():
+        # copies, so the strings are allocated while measuring
+        return [path.encode().decode() for path, _ in outputs]
+
+    def groups_and_names():
+        # the way compact entries keep a path
+        groups = []
+        names = []
+        for path in paths():
+            group, _, name = path.rpartition('/')
+            groups.append(sys.intern(group))
+            names.append(name)
+        return groups, names
+
+    def parsed():
+        # one entry at a time, each with a path of its own like a freshly read database
+        for path, lines in outputs:
+            yield DBEntry.from_lines(path.encode().decode(), lines, 'salt', fingerprinter)
+
+    sizes = []
+    for name, create in (('full', full), ('compact', lambda: list(diff_dbs.compact(parsed()))), ('paths', paths),
+                         ('groups and names', groups_and_names)):
+        # measured one after the other, nothing one of them interned is left for the next
+        sizes.append((name, bytes_per_entry(create, entries)[0]))
+    return sizes
+
+
+def random_text(rng, length):
+    return ''.join(rng.choice(string.ascii_letters + string.digits + ' ') for _ in range(length)).strip()
+
+
+def generate_entries(count, depth=3, notes_length=64, seed=0):
+    rng = random.Random(seed)
+    entries = []
+    for index in range(count):
+        groups = ['group%d' % rng.randrange(GROUP_FANOUT) for _ in range(rng.randint(0, depth))]
+        title = 'entry%d' % index
+        entries.append({'path': '/'.join(groups + [title]), 'title': title,
+                        'username': 'user%d' % rng.randrange(count),
+                        'password': ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(20)),
+                        'url': 'https://example%d.com/login' % rng.randrange(count),
+                        'notes': random_text(rng, notes_length)})
+    return entries
+
+
+def mutate_entries(entries, fraction=CHANGED_FRACTION, seed=0):
+    # changes, removes and adds the same number of entries each
+    rng = random.Random(seed)
+    entries = [dict(entry) for entry in entries]
+    count = max(1, int(len(entries) * fraction)) if entries else 0
+    for entry in rng.sample(entries, min(count, len(entries))):
+        entry['password'] = entry['password'][::-1] + '!'
+    for entry in rng.sample(entries, min(count, len(entries))):
+        entries.remove(entry)
+    for index in range(count):
+        title = 'added%d' % index
+        entries.append({'path': title, 'title': title, 'username': 'new', 'password': 'new', 'url': '',
+                        'notes': ''})
+    return entries
+
+
+def write_vault(path, entries, password=PASSWORD):
+    fake_keepassxc_cli.FakeDatabase.save(path, password, entries, name=os.path.basename(path))
+    return path
+
+
+def vault_paths(directory, size):
+    return (os.path.join(directory, 'first-%d.json' % size), os.path.join(directory, 'second-%d.json' % size))
+
+
+def create_vaults(directory, size, depth=3, notes_length=64):
+    first, second = vault_paths(directory, size)
+    entries = generate_entries(size, depth, notes_length)
+    write_vault(first, entries)
+    write_vault(second, mutate_entries(entries))
+    return first, second
+
+
+def timed(function, spent, state):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # a digest may hash the lazy password, only the outermost call is counted
+        depth = getattr(state, 'depth', 0)
+        state.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            state.depth = depth
+            if not depth:
+                spent.append(time.perf_counter() - start)
+    return wrapper
+
+
+@contextlib.contextmanager
+def timed_hashing():
+    # the hash functions are wrapped in place so that every reader is measured
+    spent = []
+    state = threading.local()
+    originals = [(owner, name, owner.__dict__[name]) for owner, name in HASH_FUNCTIONS]
+    for owner, name, original in originals:
+        if isinstance(original, classmethod):
+            setattr(owner, name, classmethod(timed(original.__func__, spent, state)))
+        else:
+            setattr(owner, name, timed(original, spent, state))
+    try:
+        yield spent
+    finally:
+        for owner, name, original in originals:
+            setattr(owner, name, original)
+
+
+def peak_rss():
+    # ru_maxrss is in KiB on Linux
+    if resource is None:
+        return None, None
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def count_processes(log_path):
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path, encoding='utf-8') as log_file:
+        return sum(1 for _ in log_file)
+
+
+def run_case(case, first, second, backend=BACKEND_EXPORT, jobs=1, log_path=None):
+    diff_dbs.KEEPASS_CLI = fake_keepassxc_cli.COMMAND
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = log_path or os.path.join(directory, 'processes.log')
+        os.environ[fake_keepassxc_cli.LOG_VARIABLE] = log_path
+        with timed_hashing() as spent:
+            start = time.perf_counter()
+            if case == CASE_READ:
+                results = len(diff_dbs.read_database_content(first, PASSWORD, backend, jobs))
+            else:
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    diff_dbs.diff_dbs([first, PASSWORD, second, PASSWORD, '--backend', backend,
+                                       '--jobs', str(jobs)])
+                results = len(output.getvalue().splitlines())
+            wall = time.perf_counter() - start
+        processes = count_processes(log_path)
+    rss, children_rss = peak_rss()
+    return {'case': case, 'backend': backend, 'jobs': jobs, 'results': results, 'wall_time': wall,
+            'processes': processes, 'hashing_time': sum(spent), 'peak_rss_kib': rss,
+            'children_peak_rss_kib': children_rss}
+
+
+def run_isolated(case, size, first, second, args):
+    # every case runs in its own interpreter so that the peak RSS belongs to that case alone
+    environment = dict(os.environ)
+    environment[fake_keepassxc_cli.LATENCY_VARIABLE] = str(args.latency)
+    environment[fake_keepassxc_cli.UNLOCK_COST_VARIABLE] = str(args.unlock_cost)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', case, first, second,
+                             '--backend', args.backend, '--jobs', str(args.jobs)],
+                            env=environment, universal_newlines=True, stdout=subprocess.PIPE, check=True)
+    result = json.loads(output.stdout)
+    result['size'] = size
+    return result
+
+
+def run_suite(args):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            first, second = create_vaults(directory, size, args.depth, args.notes_length)
+            for case in args.cases:
+                result = run_isolated(case, size, first, second, args)
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def print_result(result):
+    print('%-5s %8d entries %10.3f s %8d processes %10.3f s hashing %10s KiB peak RSS'
+          % (result['case'], result['size'], result['wall_time'], result['processes'], result['hashing_time'],
+             result['peak_rss_kib']), flush=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', help='number of passwords to hash (default: %(default)s)',
+                        dest='entries', type=int, default=20)
+    parser.add_argument('--parser-entries', help='number of show outputs to parse (default: %(default)s)',
+                        dest='parser_entries', type=int, default=10000)
+    parser.add_argument('--sizes', help='vault sizes to benchmark (default: %(default)s)',
+                        dest='sizes', type=diff_dbs.positive_integer, nargs='+', default=SIZES)
+    parser.add_argument('--cases', help='what is benchmarked (default: %(default)s)',
+                        dest='cases', choices=CASES, nargs='+', default=CASES)
+    parser.add_argument('--depth', help='maximum group depth of the generated entries (default: %(default)s)',
+                        dest='depth', type=int, default=3)
+    parser.add_argument('--notes-length', help='length of the generated notes (default: %(default)s)',
+                        dest='notes_length', type=int, default=64)
+    parser.add_argument('--backend', help='how entries are read from the databases (default: %(default)s)',
+                        dest='backend', choices=BACKENDS, default=BACKEND_EXPORT)
+    parser.add_argument('--jobs', help='number of entries fetched in parallel per database (default: %(default)s)',
+                        dest='jobs', type=diff_dbs.positive_integer, default=1)
+    parser.add_argument('--latency', help='seconds every fake keepassxc-cli command takes (default: %(default)s)',
+                        dest='latency', type=float, default=0)
+    parser.add_argument('--unlock-cost', help='seconds every fake database unlock takes (default: %(default)s)',
+                        dest='unlock_cost', type=float, default=0)
+    parser.add_argument('--json', help='also write the results to this file', dest='json', default=None)
+    parser.add_argument('--run-case', help=argparse.SUPPRESS, dest='run_case', nargs=3, default=None)
+    return parser.parse_args(argv)
+
+
+def benchmark(argv):
+    args = parse_args(argv)
+    if args.run_case is not None:
+        case, first, second = args.run_case
+        print(json.dumps(run_case(case, first, second, args.backend, args.jobs)))
+        return
+    for name, seconds in benchmark_password_hash(args.entries):
+        print('%-14s %12.6f ms per entry' % (name, seconds * 1000))
+    for name, seconds in benchmark_parser(args.parser_entries):
+        print('%-14s %12.6f ms per entry' % (name, seconds * 1000))
+    for name, size in benchmark_memory(args.parser_entries):
+        print('%-14s %12.0f bytes per entry' % (name, size))
+    results = run_suite(args)
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:])
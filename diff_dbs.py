@@ -2,16 +2,265 @@
 
 import subprocess
 import argparse
+import asyncio
 import sys
 import hashlib
+import hmac
+import secrets
+import json
+import csv
+import io
+import os
+import threading
+import queue
+import contextlib
+import collections
+import functools
+import heapq
+import tempfile
+import fnmatch
+import re
+import time
+import traceback
+import math
+import bisect
+import cProfile
+import pstats
+import ctypes
+import ctypes.util
+import select
+import struct
+import xml.etree.ElementTree
+from concurrent.futures import ThreadPoolExecutor
 
-KEEPASS_LS = ['keepassxc-cli', 'ls', '-R', '-f']
-KEEPASS_SHOW = ['keepassxc-cli', 'show', '-s']
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
+KEEPASS_CLI = ['keepassxc-cli']
+KEEPASS_LS = ['ls', '-R', '-f']
+KEEPASS_SHOW = ['show', '-s']
+KEEPASS_SHOW_ATTRIBUTE = '-a'
+KEEPASS_EXPORT = ['export', '-f', 'csv']
+KEEPASS_EXPORT_XML = ['export', '-f', 'xml']
+KEEPASS_SHOW_ATTACHMENTS = '--show-attachments'
+KEEPASS_ATTACHMENT_EXPORT = ['attachment-export', '--stdout']
+KEEPASS_OPEN = ['open']
+KEEPASS_EXIT = ['exit']
+KEEPASS_NO_ENTRY = 'Could not find entry with path'
+# for the async backend, the seconds a single call may take and how often one that took longer is started again
+KEEPASS_TIMEOUT = 60.0
+KEEPASS_RETRIES = 2
+# databases a batch reads at the same time, each one may already fetch its entries with several jobs
+BATCH_READERS = 2
 
+BACKEND_EXPORT = 'export'
+BACKEND_SESSION = 'session'
+BACKEND_SHOW = 'show'
+BACKEND_ASYNC = 'async'
+BACKENDS = [BACKEND_EXPORT, BACKEND_SESSION, BACKEND_SHOW, BACKEND_ASYNC]
 
+KIND_ADDED = 'added'
+KIND_REMOVED = 'removed'
+KIND_CHANGED = 'changed'
+KIND_MOVED = 'moved'
+KIND_RENAMED = 'renamed'
 
+MATRIX_SAME = 'same'
+MATRIX_MISSING = 'missing'
+MATRIX_NEW = 'new'
+MATRIX_DIFFERS = 'differs'
+MATRIX_ABSENT = '-'
 
+FORMAT_TEXT = 'text'
+FORMAT_JSONL = 'jsonl'
+FORMAT_JSON = 'json'
+FORMATS = [FORMAT_TEXT, FORMAT_JSONL, FORMAT_JSON]
+
+# like diff(1), argparse exits with 2 on usage errors as well
+EXIT_SAME = 0
+EXIT_DIFFERENT = 1
+EXIT_ERROR = 2
+
+DiffResult = collections.namedtuple('DiffResult', ['kind', 'path', 'first', 'second', 'fields'])
+
+ATTACHMENT_CHUNK_SIZE = 65536
+EXPORT_CHUNK_SIZE = 65536
+
+MANIFEST_VERSION = 1
+MANIFEST_SALT_SIZE = 16
+
+Manifest = collections.namedtuple('Manifest', ['salt', 'fields', 'entries'])
+
+BATCH_YAML_SUFFIXES = ('.yaml', '.yml')
+
+Batch = collections.namedtuple('Batch', ['passwords', 'pairs'])
+BatchPair = collections.namedtuple('BatchPair', ['first', 'second', 'fields', 'ignore_new_in_first',
+                                                 'ignore_new_in_second'])
+
+
+class Stats:
+    PHASE_READ = 'read'
+    PHASE_PARSE = 'parse'
+    PHASE_HASH = 'hash'
+    PHASE_COMPARE = 'compare'
+    PERCENTILES = [50, 90, 99]
+    # upper bounds of the latency histogram buckets in seconds
+    BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, float('inf')]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, enabled=False, profiling=False):
+        self.enabled = enabled
+        self.profiling = profiling
+        self.phases = collections.defaultdict(float)
+        self.phase_calls = collections.Counter()
+        self.latencies = collections.defaultdict(list)
+        self.subprocesses = collections.Counter()
+        self.profiles = []
+        self.started = time.perf_counter()
+
+    def start(self):
+        # hooks stay cheap while statistics are off
+        return time.perf_counter() if self.enabled else None
+
+    def add_phase(self, name, start):
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.phases[name] += elapsed
+            self.phase_calls[name] += 1
+
+    def add_call(self, command, start, subprocess_started=True):
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[command].append(elapsed)
+            if subprocess_started:
+                self.subprocesses[command] += 1
+
+    def add_subprocess(self, command):
+        if self.enabled:
+            with self.lock:
+                self.subprocesses[command] += 1
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = self.start()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start)
+
+    def profiled(self, function):
+        # the profiler only sees the thread it was enabled in, so worker threads bring their own
+        if not self.profiling:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # newer interpreters profile all threads from the first profile that is enabled
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.profiles.append(profile)
+        return wrapper
+
+    def dump_profile(self, path):
+        pstats.Stats(*self.profiles).dump_stats(path)
+
+    @classmethod
+    def percentile(cls, values, percent):
+        # nearest rank on sorted values
+        return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+    @classmethod
+    def histogram(cls, values):
+        counts = collections.OrderedDict((str(bound), 0) for bound in Stats.BUCKETS)
+        for value in values:
+            counts[str(Stats.BUCKETS[bisect.bisect_left(Stats.BUCKETS, value)])] += 1
+        return counts
+
+    def report(self):
+        latencies = {}
+        for command, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            latency = {'calls': len(values), 'total': sum(values), 'max': values[-1],
+                       'histogram': Stats.histogram(values)}
+            for percent in Stats.PERCENTILES:
+                latency['p%d' % percent] = Stats.percentile(values, percent)
+            latencies[command] = latency
+        # phases of concurrent reads add up and parsing and hashing happen while reading
+        return {'wall_time': time.perf_counter() - self.started,
+                'phases': {name: {'seconds': self.phases[name], 'calls': self.phase_calls[name]}
+                           for name in sorted(self.phases)},
+                'subprocesses': dict(sorted(self.subprocesses.items())),
+                'latencies': latencies}
+
+    def print_report(self, file):
+        report = self.report()
+        print('wall time: %.3f s' % report['wall_time'], file=file)
+        for name, phase in report['phases'].items():
+            print('phase %s: %.3f s in %d calls' % (name, phase['seconds'], phase['calls']), file=file)
+        print('subprocesses: %d' % sum(report['subprocesses'].values()), file=file)
+        for command, count in report['subprocesses'].items():
+            print('subprocesses %s: %d' % (command, count), file=file)
+        for command, latency in report['latencies'].items():
+            print('latency %s: %d calls, %s, max %.1f ms'
+                  % (command, latency['calls'],
+                     ', '.join('p%d %.1f ms' % (percent, latency['p%d' % percent] * 1000)
+                               for percent in Stats.PERCENTILES),
+                     latency['max'] * 1000), file=file)
+
+    def save_report(self, path):
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+STATS = Stats()
+
+
+class Fingerprinter:
+    KEY_SIZE = 32
+    KDF_ITERATIONS = 100000
+
+    def __init__(self, key=None):
+        self.key = key if key is not None else secrets.token_bytes(Fingerprinter.KEY_SIZE)
+
+    @classmethod
+    def from_secret(cls, secret, salt):
+        # only fingerprints that are persisted need a reproducible key, derive it with the slow KDF once
+        return cls(hashlib.pbkdf2_hmac('sha512', secret.encode(), salt.encode(), Fingerprinter.KDF_ITERATIONS,
+                                       dklen=Fingerprinter.KEY_SIZE))
+
+    def fingerprint(self, value):
+        start = STATS.start()
+        fingerprint = hashlib.blake2b(value.encode(), key=self.key).hexdigest()
+        STATS.add_phase(Stats.PHASE_HASH, start)
+        return fingerprint
+
+    def fingerprint_chunks(self, chunks):
+        digest = hashlib.blake2b(key=self.key)
+        for chunk in chunks:
+            start = STATS.start()
+            digest.update(chunk)
+            STATS.add_phase(Stats.PHASE_HASH, start)
+        return digest.hexdigest()
+
+
+RUN_FINGERPRINTER = Fingerprinter()
 
 
 class DBEntry:
@@ -21,13 +270,84 @@ class DBEntry:
     URL = 'URL: '
     NOTES = 'Notes: '
 
-    def __init__(self, path=None, title=None, user_name=None, password_hash=None, url=None, notes=None):
+    EXPORT_GROUP = 'Group'
+    EXPORT_TITLE = 'Title'
+    EXPORT_USERNAME = 'Username'
+    EXPORT_PASSWORD = 'Password'
+    EXPORT_URL = 'URL'
+    EXPORT_NOTES = 'Notes'
+    EXPORT_LAST_MODIFIED = 'Last Modified'
+    XML_GROUP = 'Group'
+    XML_NAME = 'Name'
+    XML_ENTRY = 'Entry'
+    XML_HISTORY = 'History'
+    XML_STRING = 'String'
+    XML_KEY = 'Key'
+    XML_VALUE = 'Value'
+
+    FIELD_TITLE = 'title'
+    FIELD_USERNAME = 'username'
+    FIELD_PASSWORD = 'password'
+    FIELD_URL = 'url'
+    FIELD_NOTES = 'notes'
+    # notes come last, multi-line values can only be told apart from the following attribute at the end
+    FIELDS = (FIELD_TITLE, FIELD_USERNAME, FIELD_PASSWORD, FIELD_URL, FIELD_NOTES)
+    EXPORT_COLUMNS = {FIELD_TITLE: EXPORT_TITLE, FIELD_USERNAME: EXPORT_USERNAME, FIELD_PASSWORD: EXPORT_PASSWORD,
+                      FIELD_URL: EXPORT_URL, FIELD_NOTES: EXPORT_NOTES}
+    FIELD_HEADERS = {FIELD_TITLE: TITLE, FIELD_USERNAME: USERNAME, FIELD_PASSWORD: PASSWORD, FIELD_URL: URL,
+                     FIELD_NOTES: NOTES}
+    # only read on request, neither is part of the CSV export
+    FIELD_CUSTOM_ATTRIBUTES = 'attributes'
+    FIELD_ATTACHMENTS = 'attachments'
+    EXTENDED_FIELDS = (FIELD_CUSTOM_ATTRIBUTES, FIELD_ATTACHMENTS)
+    FIELD_ATTRIBUTES = {FIELD_TITLE: 'title', FIELD_USERNAME: 'user_name', FIELD_PASSWORD: 'password_hash',
+                        FIELD_URL: 'url', FIELD_NOTES: 'notes', FIELD_CUSTOM_ATTRIBUTES: 'custom_attributes',
+                        FIELD_ATTACHMENTS: 'attachments'}
+    # attachment sizes and digests reveal nothing that needs a fingerprint
+    FINGERPRINTED_FIELDS = (FIELD_PASSWORD, FIELD_CUSTOM_ATTRIBUTES, FIELD_ATTACHMENTS)
+    HEADER_SEPARATOR = ': '
+    HEADER_FIELDS = {header[:-len(': ')]: field for field, header in FIELD_HEADERS.items()}
+    # newer keepassxc-cli versions print these after the notes
+    TRAILING_HEADERS = ('Uuid', 'Tags')
+    LINE_BREAK = re.compile('\r\n?')
+    ATTACHMENTS_HEADER = 'Attachments:'
+    NO_ATTACHMENTS = 'No attachments present.'
+    ATTACHMENT_INDENT = '  '
+    DIGEST_SIZE = 16
+    __slots__ = ('path', 'title', 'user_name', '_password_hash', '_password', '_password_hasher', 'url', 'notes',
+                 'custom_attributes', 'attachments')
+
+    def __init__(self, path=None, title=None, user_name=None, password_hash=None, url=None, notes=None,
+                 custom_attributes=None, attachments=None):
         self.path = path
         self.title = title
         self.user_name = user_name
         self.password_hash = password_hash
         self.url = url
         self.notes = notes
+        self.custom_attributes = custom_attributes
+        # attachment name to its size as listed by 'show', and its digest once it had to be streamed
+        self.attachments = attachments
+
+    @property
+    def password_hash(self):
+        password = self._password
+        if password is not None:
+            self._password_hash = self._password_hasher(password)
+            self._password = None
+        return self._password_hash
+
+    @password_hash.setter
+    def password_hash(self, value):
+        self._password_hash = value
+        self._password = None
+        self._password_hasher = None
+
+    def set_password(self, password, password_hasher):
+        # the password is only hashed once a comparison needs it
+        self._password_hash = None
+        self._password = password
+        self._password_hasher = password_hasher
 
     @classmethod
     def extract_value(cls, header, line):
@@ -37,28 +357,198 @@ class DBEntry:
 
     @classmethod
     def create_password_hash(cls, password, salt='salt'):
+        start = STATS.start()
         dk = hashlib.pbkdf2_hmac('sha512', password.encode(), salt.encode(), 100000)
+        STATS.add_phase(Stats.PHASE_HASH, start)
         return dk.hex()
 
     @classmethod
-    def from_lines(cls, path, lines, salt):
-        title = None
-        user_name = None
-        password_hash = None
-        url = None
+    def from_lines(cls, path, lines, salt, fingerprinter=RUN_FINGERPRINTER, fields=FIELDS, trailing_headers=False):
+        start = STATS.start()
+        values = DBEntry.parse_lines(lines, trailing_headers)
+        entry = cls.from_values(path, {field: value for field, value in values.items() if field in fields}, salt,
+                                fingerprinter)
+        STATS.add_phase(Stats.PHASE_PARSE, start)
+        return entry
+
+    @classmethod
+    def from_values(cls, path, values, salt, fingerprinter=RUN_FINGERPRINTER):
+        entry = cls(path, values.get(DBEntry.FIELD_TITLE), values.get(DBEntry.FIELD_USERNAME), None,
+                    values.get(DBEntry.FIELD_URL), values.get(DBEntry.FIELD_NOTES))
+        if DBEntry.FIELD_PASSWORD in values:
+            if fingerprinter:
+                entry.set_password(values[DBEntry.FIELD_PASSWORD], fingerprinter.fingerprint)
+            else:
+                # only on explicit request, the slow hash is meant for values that are persisted
+                entry.set_password(values[DBEntry.FIELD_PASSWORD],
+                                   lambda password: DBEntry.create_password_hash(password, salt))
+        return entry
+
+    @classmethod
+    def parse_lines(cls, lines, trailing_headers=False):
+        # one pass, every line is split once and its header looked up in a table,
+        # the notes are printed last and take all following lines
+        values = {}
         notes = None
         for line in lines:
-            value = DBEntry.extract_value(DBEntry.TITLE, line)
-            title = value if value is not None else title
-            value = DBEntry.extract_value(DBEntry.USERNAME, line)
-            user_name = value if value is not None else user_name
-            value = DBEntry.extract_value(DBEntry.PASSWORD, line)
-            password_hash = DBEntry.create_password_hash(value, salt) if value is not None else password_hash
-            value = DBEntry.extract_value(DBEntry.URL, line)
-            url = value if value is not None else url
-            value = DBEntry.extract_value(DBEntry.NOTES, line)
-            notes = value if value is not None else notes
-        return cls(path, title, user_name, password_hash, url, notes)
+            if isinstance(line, bytes):
+                line = line.decode()
+            if line.endswith('\n'):
+                line = line[:-2] if line.endswith('\r\n') else line[:-1]
+            if notes is not None:
+                notes.append(line)
+                continue
+            name, separator, value = line.partition(DBEntry.HEADER_SEPARATOR)
+            field = DBEntry.HEADER_FIELDS.get(name) if separator else None
+            if field == DBEntry.FIELD_NOTES:
+                notes = [value]
+                values[field] = notes
+            elif field is not None:
+                values[field] = value
+        if notes is not None and trailing_headers:
+            # the full 'show' output ends with headers printed after the notes, 'show -a' has none,
+            # only the ones at the very end are cut so notes lines that look like them stay notes
+            while len(notes) > 1 and DBEntry.is_trailing_header(notes[-1]):
+                notes.pop()
+        if DBEntry.FIELD_NOTES in values:
+            values[DBEntry.FIELD_NOTES] = '\n'.join(values[DBEntry.FIELD_NOTES])
+        return values
+
+    @classmethod
+    def normalize_notes(cls, notes):
+        # the line breaks 'show' ends up with, a trailing one is kept like the parser keeps it
+        return DBEntry.LINE_BREAK.sub('\n', notes)
+
+    @classmethod
+    def is_trailing_header(cls, line):
+        name, separator, _ = line.partition(DBEntry.HEADER_SEPARATOR)
+        return bool(separator) and name in DBEntry.TRAILING_HEADERS
+
+    @classmethod
+    def from_attribute_lines(cls, path, lines, salt, fingerprinter=RUN_FINGERPRINTER, fields=FIELDS):
+        if DBEntry.FIELD_ATTACHMENTS in fields:
+            return cls.from_attachment_lines(path, lines, salt, fingerprinter, fields)
+        # 'show -a' prints the bare values in the requested order, notes are requested last
+        headers = [DBEntry.FIELD_HEADERS[field] for field in fields]
+        lines = [header + value for header, value in zip(headers, lines)] + lines[len(headers):]
+        return cls.from_lines(path, lines, salt, fingerprinter, fields)
+
+    @classmethod
+    def from_attachment_lines(cls, path, lines, salt, fingerprinter=RUN_FINGERPRINTER, fields=FIELDS):
+        attachments, lines = DBEntry.split_attachments(lines)
+        entry = cls.from_lines(path, lines, salt, fingerprinter, fields, trailing_headers=True)
+        entry.attachments = attachments
+        return entry
+
+    @classmethod
+    def from_strings(cls, path, strings, salt, fingerprinter=RUN_FINGERPRINTER, fields=FIELDS):
+        # the XML export keeps every attribute apart, whatever the standard ones are not is a custom one
+        start = STATS.start()
+        values = {}
+        custom = {}
+        for name, value in strings.items():
+            field = DBEntry.HEADER_FIELDS.get(name)
+            if field is None:
+                custom[name] = value
+            elif field in fields:
+                values[field] = DBEntry.normalize_notes(value) if field == DBEntry.FIELD_NOTES else value
+        entry = cls.from_values(path, values, salt, fingerprinter)
+        if DBEntry.FIELD_CUSTOM_ATTRIBUTES in fields:
+            # custom attributes often hold secrets, so they are kept as fingerprints like the password
+            entry.custom_attributes = {name: fingerprinter.fingerprint(value) if fingerprinter else value
+                                       for name, value in custom.items()}
+        STATS.add_phase(Stats.PHASE_PARSE, start)
+        return entry
+
+    @classmethod
+    def split_attachments(cls, lines):
+        # the attachment listing comes last, separated from the attributes by an empty line
+        lines = list(lines)
+        attachments = {}
+        end = len(lines)
+        if end and lines[-1] == DBEntry.NO_ATTACHMENTS:
+            end -= 1
+        else:
+            while end and lines[end - 1].startswith(DBEntry.ATTACHMENT_INDENT):
+                end -= 1
+            if not end or lines[end - 1] != DBEntry.ATTACHMENTS_HEADER:
+                return None, lines
+            for line in lines[end:]:
+                name, _, size = line[len(DBEntry.ATTACHMENT_INDENT):].rpartition(' (')
+                attachments[name] = size[:-1]
+            end -= 1
+        if end and lines[end - 1] == '':
+            end -= 1
+        return attachments, lines[:end]
+
+    @classmethod
+    def is_extended(cls, fields):
+        return any(field in DBEntry.EXTENDED_FIELDS for field in fields)
+
+    @classmethod
+    def show_attributes(cls, fields):
+        if DBEntry.FIELD_ATTACHMENTS in fields:
+            # listed after all standard attributes
+            return [KEEPASS_SHOW_ATTACHMENTS]
+        arguments = []
+        for field in fields or [DBEntry.FIELD_TITLE]:
+            arguments += [KEEPASS_SHOW_ATTRIBUTE, DBEntry.FIELD_HEADERS[field][:-len(': ')]]
+        return arguments
+
+    @classmethod
+    def export_path(cls, row):
+        # the root group is not part of the paths listed by 'ls -R -f'
+        groups = row[DBEntry.EXPORT_GROUP].split('/')[1:]
+        return '/'.join(groups + [row[DBEntry.EXPORT_TITLE]])
+
+    @classmethod
+    def from_export_row(cls, row, salt, fingerprinter=RUN_FINGERPRINTER, fields=FIELDS):
+        start = STATS.start()
+        # only the requested columns are looked at, ignored notes cost nothing however long they are
+        values = {field: row[DBEntry.EXPORT_COLUMNS[field]] for field in fields if field in DBEntry.EXPORT_COLUMNS}
+        if DBEntry.FIELD_NOTES in values:
+            # so both backends produce identical entries
+            values[DBEntry.FIELD_NOTES] = DBEntry.normalize_notes(values[DBEntry.FIELD_NOTES])
+        entry = cls.from_values(DBEntry.export_path(row), values, salt, fingerprinter)
+        STATS.add_phase(Stats.PHASE_PARSE, start)
+        return entry
+
+    def field_value(self, field):
+        return getattr(self, DBEntry.FIELD_ATTRIBUTES[field])
+
+    def has_value(self, field):
+        return bool(self.field_value(field))
+
+    def digest(self, fields=FIELDS):
+        digest = hashlib.blake2b(digest_size=DBEntry.DIGEST_SIZE)
+        for field in fields:
+            value = self.field_value(field)
+            if value is None:
+                digest.update(b'-')
+            else:
+                if isinstance(value, dict):
+                    value = json.dumps(value, sort_keys=True)
+                # length prefixed, so moving text from one field to the next changes the digest
+                value = value.encode()
+                digest.update(b'%d:' % len(value))
+                digest.update(value)
+        return digest.digest()
+
+    def fingerprinted(self, fingerprinter, fields=FIELDS):
+        # the password and custom attributes are already fingerprinted while reading
+        values = {}
+        for field in fields:
+            value = self.field_value(field)
+            if field not in DBEntry.FINGERPRINTED_FIELDS and value is not None:
+                value = fingerprinter.fingerprint(value)
+            values[field] = value
+        return DBEntry(self.path, values.get(DBEntry.FIELD_TITLE), values.get(DBEntry.FIELD_USERNAME),
+                       values.get(DBEntry.FIELD_PASSWORD), values.get(DBEntry.FIELD_URL),
+                       values.get(DBEntry.FIELD_NOTES), values.get(DBEntry.FIELD_CUSTOM_ATTRIBUTES),
+                       values.get(DBEntry.FIELD_ATTACHMENTS))
+
+    def differing_fields(self, other, fields=FIELDS):
+        return [field for field in fields if self.field_value(field) != other.field_value(field)]
 
     def __eq__(self, other):
         return self.is_same(other)
@@ -69,7 +559,9 @@ class DBEntry:
                 ignore_username = False,
                 ignore_password = False,
                 ignore_url = False,
-                ignore_notes = False):
+                ignore_notes = False,
+                ignore_attributes = False,
+                ignore_attachments = False):
         if not isinstance(other, DBEntry):
             return NotImplemented
         return ((ignore_path or self.path == other.path)
@@ -77,15 +569,705 @@ class DBEntry:
                 and (ignore_username or self.user_name == other.user_name)
                 and (ignore_password or self.password_hash == other.password_hash)
                 and (ignore_url or self.url == other.url)
-                and (ignore_notes or self.notes == other.notes))
+                and (ignore_notes or self.notes == other.notes)
+                and (ignore_attributes or self.custom_attributes == other.custom_attributes)
+                and (ignore_attachments or self.attachments == other.attachments))
+
+
+class CompactEntry:
+    # all a diff needs of an entry: the path, split into its group and name, and a short digest per field
+    FIELD_DIGEST_SIZE = 8
+    MISSING = hashlib.blake2b(b'-', digest_size=FIELD_DIGEST_SIZE).digest()
+    EMPTY = hashlib.blake2b(b'v', digest_size=FIELD_DIGEST_SIZE).digest()
+    __slots__ = ('group', 'name', 'fields', 'digests')
+
+    def __init__(self, path, fields, digests):
+        # one string for all entries of a group, only the name is the entry's own
+        group, _, name = path.rpartition('/')
+        self.group = sys.intern(group)
+        self.name = name
+        # the same tuple for every entry of a database
+        self.fields = fields
+        self.digests = digests
+
+    @classmethod
+    def field_digest(cls, value):
+        if value is None:
+            return CompactEntry.MISSING
+        if isinstance(value, dict):
+            value = json.dumps(value, sort_keys=True)
+        return hashlib.blake2b(b'v' + value.encode(), digest_size=CompactEntry.FIELD_DIGEST_SIZE).digest()
+
+    @property
+    def path(self):
+        return self.group + '/' + self.name if self.group else self.name
+
+    @classmethod
+    def from_entry(cls, entry, fields=DBEntry.FIELDS):
+        return cls(entry.path, fields,
+                   b''.join(CompactEntry.field_digest(entry.field_value(field)) for field in fields))
+
+    def field_value(self, field):
+        start = self.fields.index(field) * CompactEntry.FIELD_DIGEST_SIZE
+        return self.digests[start:start + CompactEntry.FIELD_DIGEST_SIZE]
+
+    def has_value(self, field):
+        return self.field_value(field) not in (CompactEntry.MISSING, CompactEntry.EMPTY)
+
+    def digest(self, fields=DBEntry.FIELDS):
+        digest = hashlib.blake2b(digest_size=DBEntry.DIGEST_SIZE)
+        if fields == self.fields:
+            digest.update(self.digests)
+        else:
+            for field in fields:
+                digest.update(self.field_value(field))
+        return digest.digest()
+
+    def differing_fields(self, other, fields=DBEntry.FIELDS):
+        return [field for field in fields if self.field_value(field) != other.field_value(field)]
+
+
+class KeepassSession:
+    PROMPT_END = b'> '
+    READ_SIZE = 65536
+
+    def __init__(self, database, password):
+        self.database = database
+        self.password = password
+        self.process = None
+        self.prompt = None
+        self.stderr = b''
+        self.stderr_open = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def quote(cls, argument):
+        if '"' in argument or '\n' in argument:
+            return None
+        if ' ' in argument or argument == '':
+            return '"' + argument + '"'
+        return argument
+
+    def open(self):
+        command = KEEPASS_CLI + KEEPASS_OPEN + [self.database]
+        STATS.add_subprocess(KEEPASS_OPEN[0])
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        os.set_blocking(self.process.stderr.fileno(), False)
+        self.stderr_open = True
+        self.process.stdin.write(self.password.encode() + b'\n')
+        self.process.stdin.flush()
+        output = self._read_until_prompt()
+        # the prompt is the database name followed by '> ' and is the only output that is not newline terminated
+        self.prompt = output[output.rfind(b'\n') + 1:]
+        # the password prompt is written before the first prompt, so it is not taken for an error
+        self._take_stderr()
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(' '.join(KEEPASS_EXIT).encode() + b'\n')
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process.stderr.close()
+        self.process = None
+
+    def execute(self, command, suppress_no_entries=False):
+        arguments = [KeepassSession.quote(argument) for argument in command]
+        if None in arguments:
+            # the interactive mode cannot express such arguments, use a separate process for this command
+            return execute_keepass_command(command[:-1] + [self.database] + command[-1:], self.password,
+                                           suppress_no_entries=suppress_no_entries, check=False)
+        start = STATS.start()
+        self.process.stdin.write(' '.join(arguments).encode() + b'\n')
+        self.process.stdin.flush()
+        output = self._read_until_prompt()[:-len(self.prompt)]
+        STATS.add_call(command[0], start, subprocess_started=False)
+        # keepassxc-cli writes its errors before the next prompt, so they are in the pipe by now
+        stderr = self._take_stderr()
+        if stderr:
+            if (not suppress_no_entries) or (KEEPASS_NO_ENTRY not in stderr):
+                print('command failed: ', stderr, file=sys.stderr)
+            return
+        return output.decode().splitlines()
+
+    def _read_until_prompt(self):
+        output = b''
+        while True:
+            # stderr is read as well, a full pipe would block keepassxc-cli
+            streams = [self.process.stdout] + ([self.process.stderr] if self.stderr_open else [])
+            readable, _, _ = select.select(streams, [], [])
+            if self.process.stderr in readable:
+                self._read_stderr()
+            if self.process.stdout not in readable:
+                continue
+            chunk = os.read(self.process.stdout.fileno(), KeepassSession.READ_SIZE)
+            if not chunk:
+                self.process.wait()
+                stderr = self._take_stderr()
+                print('command failed: ', stderr, file=sys.stderr)
+                raise subprocess.CalledProcessError(self.process.returncode, self.process.args, stderr=stderr)
+            output += chunk
+            if self._ends_with_prompt(output):
+                return output
+
+    def _ends_with_prompt(self, output):
+        if self.prompt is None:
+            return output.endswith(KeepassSession.PROMPT_END)
+        return output == self.prompt or output.endswith(b'\n' + self.prompt)
+
+    def _take_stderr(self):
+        self._read_stderr()
+        stderr, self.stderr = self.stderr, b''
+        return stderr.decode(errors='replace')
+
+    def _read_stderr(self):
+        # reads what is there without waiting for more
+        while self.stderr_open:
+            try:
+                chunk = os.read(self.process.stderr.fileno(), KeepassSession.READ_SIZE)
+            except BlockingIOError:
+                return
+            if not chunk:
+                self.stderr_open = False
+            self.stderr += chunk
+
+
+class SnapshotCache:
+    MAGIC = b'KPXDIFF1'
+    SALT_SIZE = 16
+    NONCE_SIZE = 16
+    TAG_SIZE = 32
+    BLOCK_SIZE = 64
+    KEY_FILE = 'fingerprint.key'
+    SUFFIX = '.snapshot'
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+    READ_SIZE = 1024 * 1024
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # snapshots only hold fingerprints, they have to be taken with the same key on every run
+        self.fingerprinter = Fingerprinter(SnapshotCache.load_key(directory))
+
+    @classmethod
+    def load_key(cls, directory):
+        path = os.path.join(directory, SnapshotCache.KEY_FILE)
+        try:
+            descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, 'rb') as key_file:
+                return key_file.read()
+        key = secrets.token_bytes(Fingerprinter.KEY_SIZE)
+        with os.fdopen(descriptor, 'wb') as key_file:
+            key_file.write(key)
+        return key
+
+    @classmethod
+    def identify(cls, database):
+        status = os.stat(database)
+        content_hash = hashlib.sha256()
+        with open(database, 'rb') as database_file:
+            for chunk in iter(lambda: database_file.read(SnapshotCache.READ_SIZE), b''):
+                content_hash.update(chunk)
+        return [status.st_size, status.st_mtime_ns, content_hash.hexdigest()]
+
+    def snapshot_path(self, database):
+        name = hashlib.sha256(os.path.abspath(database).encode()).hexdigest()
+        return os.path.join(self.directory, name + SnapshotCache.SUFFIX)
+
+    def load(self, database, password, identity, fields):
+        path = self.snapshot_path(database)
+        try:
+            with open(path, 'rb') as snapshot_file:
+                content = SnapshotCache.decrypt(snapshot_file.read(), password)
+        except FileNotFoundError:
+            return None
+        if content is None:
+            return None
+        snapshot = json.loads(content.decode())
+        if snapshot['identity'] != identity or not set(fields) <= set(snapshot['fields']):
+            return None
+        # the modification time orders the snapshots for eviction
+        os.utime(path)
+        return [DBEntry(*values) for values in snapshot['entries']]
+
+    def store(self, database, password, identity, fields, entries):
+        snapshot = {'identity': identity, 'fields': list(fields),
+                    'entries': [[entry.path, entry.title, entry.user_name, entry.password_hash, entry.url,
+                                 entry.notes, entry.custom_attributes, entry.attachments] for entry in entries]}
+        SnapshotCache.write_private(self.snapshot_path(database),
+                                    SnapshotCache.encrypt(json.dumps(snapshot).encode(), password))
+        with self.lock:
+            self.evict()
+
+    @classmethod
+    def write_private(cls, path, content):
+        temporary = path + '.tmp%d' % threading.get_ident()
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'wb') as private_file:
+            private_file.write(content)
+        os.replace(temporary, path)
+
+    def invalidate(self, database):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.snapshot_path(database))
+
+    def snapshots(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(SnapshotCache.SUFFIX)]
+        return sorted(paths, key=os.path.getmtime)
+
+    def clear(self):
+        with self.lock:
+            for path in self.snapshots():
+                os.remove(path)
+
+    def evict(self):
+        snapshots = [(path, os.path.getsize(path)) for path in self.snapshots()]
+        total = sum(size for _, size in snapshots)
+        for path, size in snapshots:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    @classmethod
+    def derive_keys(cls, password, salt):
+        key = hashlib.pbkdf2_hmac('sha512', password.encode(), salt, Fingerprinter.KDF_ITERATIONS,
+                                  dklen=2 * Fingerprinter.KEY_SIZE)
+        return key[:Fingerprinter.KEY_SIZE], key[Fingerprinter.KEY_SIZE:]
+
+    @classmethod
+    def apply_keystream(cls, key, nonce, data):
+        # BLAKE2b in counter mode as a stream cipher, the standard library has no block cipher
+        blocks = (len(data) + SnapshotCache.BLOCK_SIZE - 1) // SnapshotCache.BLOCK_SIZE
+        stream = b''.join(hashlib.blake2b(nonce + counter.to_bytes(8, 'big'), key=key).digest()
+                          for counter in range(blocks))
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(stream[:len(data)], 'big')).to_bytes(len(data), 'big')
+
+    @classmethod
+    def encrypt(cls, content, password):
+        salt = secrets.token_bytes(SnapshotCache.SALT_SIZE)
+        nonce = secrets.token_bytes(SnapshotCache.NONCE_SIZE)
+        encryption_key, authentication_key = SnapshotCache.derive_keys(password, salt)
+        data = SnapshotCache.MAGIC + salt + nonce + SnapshotCache.apply_keystream(encryption_key, nonce, content)
+        return data + hashlib.blake2b(data, key=authentication_key, digest_size=SnapshotCache.TAG_SIZE).digest()
+
+    @classmethod
+    def decrypt(cls, data, password):
+        header_size = len(SnapshotCache.MAGIC) + SnapshotCache.SALT_SIZE + SnapshotCache.NONCE_SIZE
+        if len(data) < header_size + SnapshotCache.TAG_SIZE or not data.startswith(SnapshotCache.MAGIC):
+            return None
+        salt = data[len(SnapshotCache.MAGIC):len(SnapshotCache.MAGIC) + SnapshotCache.SALT_SIZE]
+        nonce = data[len(SnapshotCache.MAGIC) + SnapshotCache.SALT_SIZE:header_size]
+        data, tag = data[:-SnapshotCache.TAG_SIZE], data[-SnapshotCache.TAG_SIZE:]
+        encryption_key, authentication_key = SnapshotCache.derive_keys(password, salt)
+        expected = hashlib.blake2b(data, key=authentication_key, digest_size=SnapshotCache.TAG_SIZE).digest()
+        if not hmac.compare_digest(expected, tag):
+            return None
+        return SnapshotCache.apply_keystream(encryption_key, nonce, data[header_size:])
+
+
+class EntryIndex:
+    SUFFIX = '.index'
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # like the snapshots, the index only holds fingerprints taken with a key that is kept
+        self.fingerprinter = Fingerprinter(SnapshotCache.load_key(directory))
+
+    def index_path(self, database):
+        name = hashlib.sha256(os.path.abspath(database).encode()).hexdigest()
+        return os.path.join(self.directory, name + EntryIndex.SUFFIX)
+
+    def load(self, database, password, fields):
+        # path to the last modification time and the entry as it was then
+        try:
+            with open(self.index_path(database), 'rb') as index_file:
+                content = SnapshotCache.decrypt(index_file.read(), password)
+        except FileNotFoundError:
+            return {}
+        if content is None:
+            return {}
+        index = json.loads(content.decode())
+        if not set(fields) <= set(index['fields']):
+            return {}
+        return {values[0]: (modified, DBEntry(*values)) for modified, values in index['entries']}
+
+    def store(self, database, password, fields, records):
+        index = {'fields': list(fields),
+                 'entries': [[modified, [entry.path, entry.title, entry.user_name, entry.password_hash, entry.url,
+                                         entry.notes, entry.custom_attributes, entry.attachments]]
+                             for modified, entry in records.values()]}
+        SnapshotCache.write_private(self.index_path(database),
+                                    SnapshotCache.encrypt(json.dumps(index).encode(), password))
+
+
+class MerkleTree:
+    ROOT = ''
+    ENTRY = b'e'
+    GROUP = b'g'
+
+    def __init__(self, database, fields=DBEntry.FIELDS):
+        self.entries = {path: entry.digest(fields) for path, entry in database.items()}
+        self.members = {MerkleTree.ROOT: ([], set())}
+        for path in self.entries:
+            group = MerkleTree.parent(path)
+            self.members.setdefault(group, ([], set()))[0].append(path)
+            while group != MerkleTree.ROOT:
+                parent = MerkleTree.parent(group)
+                subgroups = self.members.setdefault(parent, ([], set()))[1]
+                if group in subgroups:
+                    break
+                subgroups.add(group)
+                group = parent
+        self.groups = {}
+        for group in sorted(self.members, key=MerkleTree.depth, reverse=True):
+            self.groups[group] = self.group_digest(group)
+
+    @classmethod
+    def parent(cls, path):
+        # groups are shared by many entries and by both trees
+        return sys.intern(path.rpartition('/')[0])
+
+    @classmethod
+    def depth(cls, group):
+        return group.count('/') + 1 if group else 0
+
+    def group_digest(self, group):
+        # children are digested before their parents, so the subgroup digests are known here
+        entries, subgroups = self.members[group]
+        digest = hashlib.blake2b(digest_size=DBEntry.DIGEST_SIZE)
+        for kind, children, digests in ((MerkleTree.ENTRY, entries, self.entries),
+                                        (MerkleTree.GROUP, subgroups, self.groups)):
+            for child in sorted(children):
+                name = child.encode()
+                digest.update(kind + b'%d:' % len(name) + name + digests[child])
+        return digest.digest()
+
+    @property
+    def root(self):
+        return self.groups[MerkleTree.ROOT]
+
+
+class SortedRuns:
+    DEFAULT_RUN_SIZE = 10000
+
+    def __init__(self, entries, run_size=DEFAULT_RUN_SIZE):
+        # at most one run is held in memory, full runs are sorted and moved to temporary files
+        self.runs = []
+        self.last = []
+        for entry in entries:
+            self.last.append(entry)
+            if len(self.last) >= run_size:
+                self.runs.append(SortedRuns.spill(self.last))
+                self.last = []
+        self.last.sort(key=SortedRuns.key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return heapq.merge(*[SortedRuns.load(run) for run in self.runs], self.last, key=SortedRuns.key)
+
+    @classmethod
+    def key(cls, entry):
+        return entry.path
+
+    @classmethod
+    def spill(cls, entries):
+        entries.sort(key=SortedRuns.key)
+        run = tempfile.TemporaryFile('w+', encoding='utf-8')
+        for entry in entries:
+            run.write(json.dumps([entry.path] + [entry.field_value(field)
+                                                 for field in DBEntry.FIELDS + DBEntry.EXTENDED_FIELDS]) + '\n')
+        run.seek(0)
+        return run
+
+    @classmethod
+    def load(cls, run):
+        for line in run:
+            yield DBEntry(*json.loads(line))
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.last = []
+
+
+class PathFilter:
+    REGEX_PREFIX = 're:'
+    # paths have no leading '/', like a glob a regular expression anchored at '^/' is anchored at the root
+    ROOT_ANCHOR = re.compile(r'^((?:\(\?[aiLmsux]+\))*\^)/')
+
+    def __init__(self, include=(), exclude=()):
+        self.include = PathFilter.compile(include)
+        self.exclude = PathFilter.compile(exclude)
+
+    @classmethod
+    def compile(cls, patterns):
+        # one alternation for all globs, so every path is matched once however many globs there are
+        if not patterns:
+            return None
+        globs = [fnmatch.translate(pattern.lstrip('/')) for pattern in patterns
+                 if not pattern.startswith(PathFilter.REGEX_PREFIX)]
+        matchers = [re.compile('|'.join(globs)).match] if globs else []
+        # regular expressions match anywhere in the path, each on its own so inline flags keep working
+        for pattern in patterns:
+            if pattern.startswith(PathFilter.REGEX_PREFIX):
+                expression = PathFilter.ROOT_ANCHOR.sub(r'\1', pattern[len(PathFilter.REGEX_PREFIX):])
+                matchers.append(re.compile(expression).search)
+        return matchers
+
+    def matches(self, path):
+        if self.include is not None and not any(match(path) for match in self.include):
+            return False
+        return self.exclude is None or not any(match(path) for match in self.exclude)
+
+    def filter(self, paths):
+        # groups are listed with a trailing '/' and would only make 'show' fail
+        return [path for path in paths if not path.endswith('/') and self.matches(path)]
+
+
+class FileWatcher:
+    DEFAULT_DEBOUNCE = 1.0
+    DEFAULT_INTERVAL = 2.0
+    # see inotify(7), the directory is watched since a database is usually saved by renaming a new file over it
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    EVENT = struct.Struct('iIII')
+    READ_SIZE = 65536
+
+    def __init__(self, paths, debounce=DEFAULT_DEBOUNCE, interval=DEFAULT_INTERVAL, use_inotify=True):
+        self.paths = {os.path.abspath(path): path for path in paths}
+        self.debounce = debounce
+        self.interval = interval
+        self.signatures = {path: FileWatcher.signature(path) for path in self.paths}
+        self.directories = {}
+        self.descriptor = self.start_inotify() if use_inotify else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.descriptor is not None:
+            os.close(self.descriptor)
+            self.descriptor = None
+
+    @classmethod
+    def load_libc(cls):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return None
+        return libc
+
+    def start_inotify(self):
+        # polling is the fallback wherever inotify is not available
+        libc = FileWatcher.load_libc()
+        if libc is None:
+            return None
+        descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if descriptor < 0:
+            return None
+        mask = FileWatcher.IN_CLOSE_WRITE | FileWatcher.IN_MOVED_TO | FileWatcher.IN_CREATE
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            watch = libc.inotify_add_watch(descriptor, os.fsencode(directory), mask)
+            if watch < 0:
+                os.close(descriptor)
+                self.directories = {}
+                return None
+            self.directories[watch] = directory
+        return descriptor
+
+    @classmethod
+    def signature(cls, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def poll(self):
+        changed = set()
+        for path, name in self.paths.items():
+            signature = FileWatcher.signature(path)
+            if signature != self.signatures[path]:
+                self.signatures[path] = signature
+                changed.add(name)
+        return changed
+
+    def read_events(self, timeout):
+        readable, _, _ = select.select([self.descriptor], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.descriptor, FileWatcher.READ_SIZE)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            watch, _, _, length = FileWatcher.EVENT.unpack_from(data, offset)
+            offset += FileWatcher.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            path = os.path.join(self.directories.get(watch, ''), name)
+            if path in self.paths:
+                changed.add(self.paths[path])
+        return changed
+
+    def wait(self, timeout=None):
+        # returns as soon as a watched file changed, or with nothing once the timeout passed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if self.descriptor is not None:
+                changed = self.read_events(remaining)
+            else:
+                time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+                changed = self.poll()
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def changes(self):
+        while True:
+            changed = self.wait()
+            # saving a database takes several writes, it is read once they settled
+            while True:
+                more = self.wait(self.debounce)
+                if not more:
+                    break
+                changed |= more
+            yield changed
+
+
+class AdaptiveLimit:
+    # additive increase, multiplicative decrease: one more call in flight after a window of calls that went well,
+    # half as many after a call that failed or took much longer than the fastest one so far
+    LATENCY_FACTOR = 3.0
+    DECREASE = 0.5
+
+    def __init__(self, maximum, initial=1):
+        self.maximum = maximum
+        self.limit = float(min(initial, maximum))
+        self.in_flight = 0
+        self.fastest = None
+        # calls that were in flight together are slow together, they only decrease the limit once
+        self.since_decrease = self.limit
+        self.condition = None
+
+    def record(self, latency, failed=False):
+        slow = self.fastest is not None and latency > self.fastest * AdaptiveLimit.LATENCY_FACTOR
+        if not failed:
+            self.fastest = latency if self.fastest is None else min(self.fastest, latency)
+        self.since_decrease += 1
+        if failed or slow:
+            if self.since_decrease >= self.limit:
+                self.limit = max(1.0, self.limit * AdaptiveLimit.DECREASE)
+                self.since_decrease = 0
+        else:
+            self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+
+    async def acquire(self):
+        # created here, it belongs to the event loop that runs the calls
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+class PathSet:
+    # selects exactly these entries, wherever a PathFilter is taken
+
+    def __init__(self, paths):
+        self.paths = set(paths)
+
+    def matches(self, path):
+        return path in self.paths
+
+    def filter(self, paths):
+        return [path for path in paths if path in self.paths]
+
+
+class Report:
+    # text and JSON Lines are written as soon as a difference is known, a JSON document once all of them are
+
+    def __init__(self, output_format=FORMAT_TEXT):
+        self.output_format = output_format
+        self.records = []
+        self.differences = 0
+
+    def write(self, line):
+        print(line, flush=True)
+
+    def add(self, args, second_name, result, resolved=False):
+        if not is_reported(args, result):
+            return
+        if not resolved:
+            self.differences += 1
+        if self.output_format == FORMAT_TEXT:
+            self.write(('resolved: ' if resolved else '') + result_message(args, second_name, result))
+            return
+        record = result_record(args, second_name, result)
+        if resolved:
+            record['resolved'] = True
+        if self.output_format == FORMAT_JSONL:
+            self.write(json.dumps(record))
+        else:
+            self.records.append(record)
+
+    def close(self):
+        if self.output_format == FORMAT_JSON:
+            self.write(json.dumps({'differences': self.records}, indent=2))
+
+    @property
+    def exit_code(self):
+        return EXIT_DIFFERENT if self.differences else EXIT_SAME
 
 
 def execute_keepass_command(command, password, suppress_no_entries=False, check=True):
-    output = subprocess.run(command, input=password,
+    start = STATS.start()
+    output = subprocess.run(KEEPASS_CLI + command, input=password,
                             universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    STATS.add_call(command[0], start)
     if output.returncode:
-        if (not suppress_no_entries) or ('Could not find entry with path' not in output.stderr):
-            print('command failed: ', output.stderr)
+        if (not suppress_no_entries) or (KEEPASS_NO_ENTRY not in output.stderr):
+            print('command failed: ', output.stderr, file=sys.stderr)
         if check:
             output.check_returncode()
         else:
@@ -93,12 +1275,271 @@ def execute_keepass_command(command, password, suppress_no_entries=False, check=
     return output.stdout.splitlines()
 
 
+def stream_keepass_command(command, password, chunk_size=None):
+    start = STATS.start()
+    name = command[0]
+    command = KEEPASS_CLI + command
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        process.stdin.write(password.encode())
+        process.stdin.close()
+        if chunk_size is None:
+            yield from io.TextIOWrapper(process.stdout, encoding='utf-8', newline='')
+        else:
+            yield from iter(functools.partial(process.stdout.read, chunk_size), b'')
+        stderr = process.stderr.read().decode(errors='replace')
+        process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        STATS.add_call(name, start)
+    if process.returncode:
+        print('command failed: ', stderr, file=sys.stderr)
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+
+async def run_keepass_command_async(command, password, limit, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    # the caller holds a slot of the limit, every attempt tells it how the call went
+    for _ in range(retries + 1):
+        start = STATS.start()
+        began = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(*(KEEPASS_CLI + command), stdin=subprocess.PIPE,
+                                                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except BlockingIOError:
+            # out of processes, there will be fewer at once from now on
+            limit.record(time.perf_counter() - began, failed=True)
+            continue
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(password.encode()), timeout)
+        except asyncio.TimeoutError:
+            limit.record(time.perf_counter() - began, failed=True)
+            continue
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            STATS.add_call(command[0], start)
+        stderr = stderr.decode(errors='replace')
+        # a missing entry is an answer, any other error counts against the limit like a timeout
+        limit.record(time.perf_counter() - began, failed=bool(process.returncode) and KEEPASS_NO_ENTRY not in stderr)
+        return process.returncode, stdout.decode(), stderr
+    raise subprocess.TimeoutExpired(KEEPASS_CLI + command, timeout)
+
+
+async def fetch_entry_async(command, password, path, limit, timeout, retries, fingerprinter, fields):
+    try:
+        returncode, stdout, stderr = await run_keepass_command_async(command + [path], password, limit, timeout,
+                                                                     retries)
+    finally:
+        await limit.release()
+    if returncode:
+        if KEEPASS_NO_ENTRY not in stderr:
+            print('command failed: ', stderr, file=sys.stderr)
+        return None
+    lines = stdout.splitlines()
+    return DBEntry.from_attribute_lines(path, lines, 'salt', fingerprinter, fields) if lines else None
+
+
+async def read_database_async(database, password, jobs=1, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                              path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    # entries are fetched while 'ls' is still listing, the results keep the order of the listing
+    show = KEEPASS_SHOW + DBEntry.show_attributes(fields) + [database]
+    limit = AdaptiveLimit(jobs)
+    tasks = []
+    start = STATS.start()
+    command = KEEPASS_CLI + KEEPASS_LS + [database]
+    process = await asyncio.create_subprocess_exec(*command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                   stderr=subprocess.PIPE)
+    try:
+        process.stdin.write(password.encode())
+        process.stdin.close()
+        while True:
+            line = (await asyncio.wait_for(process.stdout.readline(), timeout)).decode()
+            if not line:
+                break
+            path = line[:-1] if line.endswith('\n') else line
+            # groups have nothing to show
+            if path.endswith('/') or (path_filter is not None and not path_filter.matches(path)):
+                continue
+            await limit.acquire()
+            tasks.append(asyncio.ensure_future(fetch_entry_async(show, password, path, limit, timeout, retries,
+                                                                 fingerprinter, fields)))
+        stderr = (await asyncio.wait_for(process.stderr.read(), timeout)).decode(errors='replace')
+        await asyncio.wait_for(process.wait(), timeout)
+        if process.returncode:
+            print('command failed: ', stderr, file=sys.stderr)
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+        entries = []
+        for task in tasks:
+            entry = await task
+            if entry is not None:
+                entries.append(entry)
+        return entries
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(command, timeout)
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        STATS.add_call(KEEPASS_LS[0], start)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iter_database_async(database, password, jobs=1, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                        path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    yield from asyncio.run(read_database_async(database, password, jobs, fingerprinter, fields, path_filter, timeout,
+                                               retries))
+
+
+def attachment_digest(database, password, path, name, fingerprinter=RUN_FINGERPRINTER):
+    # fed in fixed size chunks, so memory stays the same whatever the size of the attachment
+    return fingerprinter.fingerprint_chunks(
+        stream_keepass_command(KEEPASS_ATTACHMENT_EXPORT + [database, path, name], password, ATTACHMENT_CHUNK_SIZE))
+
+
+def resolve_attachments(first_database, second_database, first_source, second_source, jobs=1,
+                        fingerprinter=RUN_FINGERPRINTER):
+    # attachments that differ in name or size already differ, only the others are streamed from both databases
+    pending = []
+    for path, first_entry in first_database.items():
+        second_entry = second_database.get(path)
+        if second_entry is None or not first_entry.attachments or first_entry.attachments != second_entry.attachments:
+            continue
+        pending.extend((path, name) for name in sorted(first_entry.attachments))
+
+    def fetch(item):
+        path, name = item
+        return [attachment_digest(database, password, path, name, fingerprinter)
+                for database, password in (first_source, second_source)]
+
+    for (path, name), digests in zip(pending, imap_ordered(fetch, pending, jobs)):
+        for database, digest in zip((first_database, second_database), digests):
+            attachments = database[path].attachments
+            attachments[name] = '%s %s' % (attachments[name], digest)
+
+
+def imap_ordered(function, items, jobs):
+    if jobs <= 1:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # only a bounded number of results wait for the consumer
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) > 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def map_ordered(function, items, jobs):
+    return list(imap_ordered(function, items, jobs))
+
+
+def positive_integer(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('%s is not a positive integer' % value)
+    return number
+
+
+def non_negative_integer(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError('%s is not a non-negative integer' % value)
+    return number
+
+
 def parse_args(argv):
     parser = argparse.ArgumentParser()
-    parser.add_argument('database1', help='the first database to compare')
-    parser.add_argument('password1', help='the password of the first database')
-    parser.add_argument('database2', help='the second database to compare')
-    parser.add_argument('password2', help='the password of the second database')
+    parser.add_argument('database1', help='the first database to compare', nargs='?')
+    parser.add_argument('password1', help='the password of the first database', nargs='?')
+    parser.add_argument('database2', help='the second database to compare', nargs='?')
+    parser.add_argument('password2', help='the password of the second database', nargs='?')
+
+    parser.add_argument('--compare', help='another database to compare against the first one, prints a matrix '
+                                          'of all differences',
+                        dest='others', nargs=2, metavar=('DATABASE', 'PASSWORD'), action='append', default=[])
+
+    parser.add_argument('--batch', help='compare all database pairs listed in this JSON or YAML file',
+                        dest='batch', default=None)
+
+    parser.add_argument('--backend', help='how entries are read from the databases (default: %(default)s)',
+                        dest='backend', choices=BACKENDS, default=BACKEND_EXPORT)
+    parser.add_argument('--jobs', help='number of entries fetched in parallel per database, the most the async '
+                                       'backend goes up to (default: %(default)s)',
+                        dest='jobs', type=positive_integer, default=1)
+    parser.add_argument('--timeout', help='seconds a keepassxc-cli call of the async backend may take '
+                                          '(default: %(default)s)',
+                        dest='timeout', type=float, default=KEEPASS_TIMEOUT)
+    parser.add_argument('--retries', help='how often the async backend starts a call that timed out again '
+                                          '(default: %(default)s)',
+                        dest='retries', type=non_negative_integer, default=KEEPASS_RETRIES)
+
+    parser.add_argument('--cache-dir', help='keep encrypted snapshots of unchanged databases in this directory',
+                        dest='cache_dir', default=None)
+    parser.add_argument('--cache-max-size', help='maximum size of all snapshots in bytes (default: %(default)s)',
+                        dest='cache_max_size', type=positive_integer, default=SnapshotCache.DEFAULT_MAX_SIZE)
+    parser.add_argument('--cache-clear', help='remove all snapshots before reading the databases',
+                        dest='cache_clear', action='store_true', default=False)
+
+    parser.add_argument('--index-dir', help='keep an encrypted index of when every entry was modified in this '
+                                            'directory, and only read entries modified since the last run',
+                        dest='index_dir', default=None)
+
+    parser.add_argument('--stream', help='diff path-sorted entry streams with bounded memory',
+                        dest='stream', action='store_true', default=False)
+    parser.add_argument('--run-size', help='entries sorted in memory before spilling to disk in stream mode '
+                                           '(default: %(default)s)',
+                        dest='run_size', type=positive_integer, default=SortedRuns.DEFAULT_RUN_SIZE)
+
+    parser.add_argument('--write-manifest', help='write a fingerprint manifest of the first database to this file',
+                        dest='write_manifest', default=None)
+    parser.add_argument('--baseline', help='compare the first database against this fingerprint manifest',
+                        dest='baseline', default=None)
+    parser.add_argument('--manifest-key', help='the secret the manifest fingerprints are keyed with',
+                        dest='manifest_key', default=None)
+
+    parser.add_argument('--format', help='how differences are printed, jsonl writes one JSON object per difference '
+                                         'as soon as it is found (default: %(default)s)',
+                        dest='format', choices=FORMATS, default=FORMAT_TEXT)
+
+    parser.add_argument('--stats', help='report timings, subprocess counts and command latencies on stderr',
+                        dest='stats', action='store_true', default=False)
+    parser.add_argument('--stats-json', help='write the statistics as JSON to this file',
+                        dest='stats_json', default=None)
+    parser.add_argument('--profile', help='write a cProfile dump of the run to this file',
+                        dest='profile', default=None)
+
+    parser.add_argument('--watch', help='keep running and report differences that appear or are resolved whenever '
+                                        'one of the databases changes',
+                        dest='watch', action='store_true', default=False)
+    parser.add_argument('--watch-debounce', help='seconds without further writes before a changed database is read '
+                                                 '(default: %(default)s)',
+                        dest='watch_debounce', type=float, default=FileWatcher.DEFAULT_DEBOUNCE)
+    parser.add_argument('--watch-interval', help='seconds between checks where inotify is not available '
+                                                 '(default: %(default)s)',
+                        dest='watch_interval', type=float, default=FileWatcher.DEFAULT_INTERVAL)
+
+    parser.add_argument('--detect-moves', help='report entries that were moved to another group or renamed',
+                        dest='detect_moves', action='store_true', default=False)
+
+    parser.add_argument('--include', help='only compare entries whose path matches this glob, or this regular '
+                                          'expression when prefixed with re:',
+                        dest='include', action='append', default=[])
+    parser.add_argument('--exclude', help='do not compare entries whose path matches this glob, or this regular '
+                                          'expression when prefixed with re:',
+                        dest='exclude', action='append', default=[])
+
+    parser.add_argument('--attributes', help='also compare custom attributes',
+                        dest='attributes', action='store_true', default=False)
+    parser.add_argument('--attachments', help='also compare attachments, by streaming digests of their content',
+                        dest='attachments', action='store_true', default=False)
 
     parser.add_argument('--ignore-new-in-first', help='ignore new entries in the first database',
                         dest='ignore_new_in_first', action='store_true', default=False)
@@ -116,18 +1557,405 @@ def parse_args(argv):
     parser.add_argument('--ignore-notes', help='do not compare notes',
                         dest='ignore_notes', action='store_true', default=False)
 
-    return parser.parse_args(argv)
+    args = parser.parse_args(argv)
+    try:
+        selected_paths(args)
+    except re.error as error:
+        parser.error('invalid path pattern: %s' % error)
+    if args.format == FORMAT_JSON and args.watch:
+        parser.error('--format json cannot be combined with --watch')
+    if args.batch is not None:
+        if (args.database1 is not None or args.others or args.stream or args.write_manifest or args.baseline
+                or args.attributes or args.attachments or args.watch):
+            parser.error('--batch cannot be combined with databases, --compare, --stream, --write-manifest, '
+                         '--baseline, --attributes, --attachments or --watch')
+        return args
+    if args.password1 is None:
+        parser.error('the following arguments are required: database1, password1')
+    if args.attachments and (args.others or args.stream or args.cache_dir or args.write_manifest or args.baseline):
+        parser.error('--attachments cannot be combined with --compare, --stream, --cache-dir, --write-manifest or '
+                     '--baseline')
+    manifest = args.write_manifest is not None or args.baseline is not None
+    if args.index_dir is not None and (args.cache_dir is not None or manifest or args.attachments):
+        parser.error('--index-dir cannot be combined with --cache-dir, --write-manifest, --baseline or --attachments')
+    if manifest and args.database2 is not None:
+        parser.error('database2 cannot be combined with --write-manifest or --baseline')
+    if not manifest and args.database2 is None:
+        parser.error('the following arguments are required: database2, password2')
+    if not manifest and args.password2 is None:
+        parser.error('the following arguments are required: password2')
+    if args.others and (manifest or args.stream or args.detect_moves):
+        parser.error('--compare cannot be combined with --write-manifest, --baseline, --stream or --detect-moves')
+    if args.watch and (manifest or args.others or args.stream or args.attachments):
+        parser.error('--watch cannot be combined with --compare, --stream, --write-manifest, --baseline or '
+                     '--attachments')
+    if manifest and args.manifest_key is None:
+        parser.error('--manifest-key is required with --write-manifest and --baseline')
+    return args
 
 
-def read_database_content(database, password):
-    result = []
+def parse_export(lines, salt, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS, path_filter=None):
+    for row in csv.DictReader(lines):
+        if path_filter is None or path_filter.matches(DBEntry.export_path(row)):
+            yield DBEntry.from_export_row(row, salt, fingerprinter, fields)
+
+
+def iter_database_export(database, password, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                         path_filter=None):
+    return parse_export(stream_keepass_command(KEEPASS_EXPORT + [database], password), 'salt', fingerprinter, fields,
+                        path_filter)
+
+
+def read_database_export(database, password, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                         path_filter=None):
+    return list(iter_database_export(database, password, fingerprinter, fields, path_filter))
+
+
+def parse_export_xml(chunks, salt, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS, path_filter=None):
+    parser = xml.etree.ElementTree.XMLPullParser(['start', 'end'])
+    tags = []
+    groups = []
+    history = 0
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                tags.append(element.tag)
+                if element.tag == DBEntry.XML_GROUP:
+                    groups.append('')
+                elif element.tag == DBEntry.XML_HISTORY:
+                    history += 1
+                continue
+            tags.pop()
+            if element.tag == DBEntry.XML_NAME and tags and tags[-1] == DBEntry.XML_GROUP:
+                groups[-1] = element.text or ''
+            elif element.tag == DBEntry.XML_HISTORY:
+                history -= 1
+            elif element.tag == DBEntry.XML_GROUP:
+                groups.pop()
+            elif element.tag == DBEntry.XML_ENTRY and not history:
+                # earlier versions of the entry are kept in its history and are not compared
+                strings = {string.findtext(DBEntry.XML_KEY): string.findtext(DBEntry.XML_VALUE) or ''
+                           for string in element.findall(DBEntry.XML_STRING)}
+                # the root group is not part of the paths listed by 'ls -R -f'
+                path = '/'.join(groups[1:] + [strings.get(DBEntry.EXPORT_TITLE, '')])
+                if path_filter is None or path_filter.matches(path):
+                    yield DBEntry.from_strings(path, strings, salt, fingerprinter, fields)
+            # only an entry needs its elements until it ends, anything else, like the attachments the meta data
+            # holds, is let go as soon as it is complete
+            if DBEntry.XML_ENTRY not in tags:
+                element.clear()
+    parser.close()
+
+
+def iter_database_xml(database, password, backend=BACKEND_EXPORT, jobs=1, fingerprinter=RUN_FINGERPRINTER,
+                      fields=DBEntry.FIELDS, path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    entries = parse_export_xml(stream_keepass_command(KEEPASS_EXPORT_XML + [database], password, EXPORT_CHUNK_SIZE),
+                               'salt', fingerprinter, fields, path_filter)
+    if DBEntry.FIELD_ATTACHMENTS not in fields:
+        yield from entries
+        return
+    # attachments are still listed entry by entry, with the sizes 'show' prints
+    entries = list(entries)
+    attachments = {entry.path: entry.attachments
+                   for entry in iter_database_content(database, password, backend, jobs, fingerprinter,
+                                                      (DBEntry.FIELD_ATTACHMENTS,),
+                                                      PathSet(entry.path for entry in entries), timeout, retries)}
+    for entry in entries:
+        entry.attachments = attachments.get(entry.path)
+        yield entry
+
+
+def iter_database_content(database, password, backend=BACKEND_EXPORT, jobs=1, fingerprinter=RUN_FINGERPRINTER,
+                          fields=DBEntry.FIELDS, path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    if DBEntry.FIELD_CUSTOM_ATTRIBUTES in fields:
+        # 'show --all' prints custom attributes just like notes lines, only the XML export tells them apart
+        yield from iter_database_xml(database, password, backend, jobs, fingerprinter, fields, path_filter, timeout,
+                                     retries)
+        return
+    if backend == BACKEND_EXPORT and DBEntry.FIELD_ATTACHMENTS in fields:
+        # the CSV export has no attachments
+        backend = BACKEND_SESSION
+    if backend == BACKEND_EXPORT:
+        count = 0
+        try:
+            for entry in iter_database_export(database, password, fingerprinter, fields, path_filter):
+                count += 1
+                yield entry
+            return
+        except subprocess.CalledProcessError:
+            # entries that were already handed out cannot be taken back
+            if count:
+                raise
+            print('export failed, falling back to reading entry by entry', file=sys.stderr)
+            backend = BACKEND_SESSION
+    if backend == BACKEND_SESSION:
+        yield from iter_database_session(database, password, jobs, fingerprinter, fields, path_filter)
+        return
+    if backend == BACKEND_ASYNC:
+        yield from iter_database_async(database, password, jobs, fingerprinter, fields, path_filter, timeout, retries)
+        return
+    show = KEEPASS_SHOW + DBEntry.show_attributes(fields)
+
+    def fetch(path):
+        entry = execute_keepass_command(show + [database, path], password, suppress_no_entries=True, check=False)
+        return DBEntry.from_attribute_lines(path, entry, 'salt', fingerprinter, fields) if entry else None
+
     lines = execute_keepass_command(KEEPASS_LS + [database], password)
-    for path in lines:
-        entry = execute_keepass_command(KEEPASS_SHOW + [database, path], password, suppress_no_entries=True,
-                                        check=False)
-        if entry:
-            result.append(DBEntry.from_lines(path, entry, 'salt'))
-    return result
+    if path_filter is not None:
+        lines = path_filter.filter(lines)
+    yield from (entry for entry in imap_ordered(fetch, lines, jobs) if entry)
+
+
+def read_database_content(database, password, backend=BACKEND_EXPORT, jobs=1, fingerprinter=RUN_FINGERPRINTER,
+                          fields=DBEntry.FIELDS, path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    return list(iter_database_content(database, password, backend, jobs, fingerprinter, fields, path_filter, timeout,
+                                      retries))
+
+
+def iter_database_session(database, password, jobs=1, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                          path_filter=None):
+    show = KEEPASS_SHOW + DBEntry.show_attributes(fields)
+    with contextlib.ExitStack() as stack:
+        session = stack.enter_context(KeepassSession(database, password))
+        lines = session.execute(KEEPASS_LS) or []
+        if path_filter is not None:
+            lines = path_filter.filter(lines)
+        # every session unlocks the database once, so never open more of them than there are entries
+        sessions = [session] + [KeepassSession(database, password) for _ in range(min(jobs, len(lines)) - 1)]
+        for other in sessions[1:]:
+            stack.callback(other.close)
+        map_ordered(KeepassSession.open, sessions[1:], jobs)
+        idle = queue.Queue()
+        for other in sessions:
+            idle.put(other)
+
+        def fetch(path):
+            current = idle.get()
+            try:
+                entry = current.execute(show + [path], suppress_no_entries=True)
+            finally:
+                idle.put(current)
+            return DBEntry.from_attribute_lines(path, entry, 'salt', fingerprinter, fields) if entry else None
+
+        yield from (entry for entry in imap_ordered(fetch, lines, jobs) if entry)
+
+
+def read_database_session(database, password, jobs=1, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                          path_filter=None):
+    return list(iter_database_session(database, password, jobs, fingerprinter, fields, path_filter))
+
+
+def read_database_cached(cache, database, password, backend=BACKEND_EXPORT, jobs=1, fields=DBEntry.FIELDS,
+                         path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    # snapshots always hold the whole database, so they serve any filter
+    identity = SnapshotCache.identify(database)
+    entries = cache.load(database, password, identity, fields)
+    if entries is None:
+        entries = [entry.fingerprinted(cache.fingerprinter, fields)
+                   for entry in read_database_content(database, password, backend, jobs, cache.fingerprinter, fields,
+                                                      timeout=timeout, retries=retries)]
+        cache.store(database, password, identity, fields, entries)
+    if path_filter is not None:
+        entries = [entry for entry in entries if path_filter.matches(entry.path)]
+    return entries
+
+
+def read_database_indexed(index, database, password, backend=BACKEND_EXPORT, jobs=1, fields=DBEntry.FIELDS,
+                          path_filter=None, timeout=KEEPASS_TIMEOUT, retries=KEEPASS_RETRIES):
+    # the export tells when every entry was modified, only the entries modified since the last run are read again
+    try:
+        rows = [row for row in csv.DictReader(stream_keepass_command(KEEPASS_EXPORT + [database], password))
+                if path_filter is None or path_filter.matches(DBEntry.export_path(row))]
+    except subprocess.CalledProcessError:
+        print('export failed, reading all entries', file=sys.stderr)
+        return [entry.fingerprinted(index.fingerprinter, fields)
+                for entry in read_database_content(database, password, backend, jobs, index.fingerprinter, fields,
+                                                   path_filter, timeout, retries)]
+    known = index.load(database, password, fields)
+    # entries the filter hides stay in the index for the next run
+    records = {path: record for path, record in known.items()
+               if path_filter is not None and not path_filter.matches(path)}
+    modified = {}
+    stale = []
+    for row in rows:
+        path = DBEntry.export_path(row)
+        modified[path] = row.get(DBEntry.EXPORT_LAST_MODIFIED, '')
+        record = known.get(path)
+        if modified[path] and record is not None and record[0] == modified[path]:
+            records[path] = record
+        elif backend == BACKEND_EXPORT and not DBEntry.is_extended(fields):
+            # the row has all there is to read
+            entry = DBEntry.from_export_row(row, 'salt', index.fingerprinter, fields)
+            records[path] = (modified[path], entry.fingerprinted(index.fingerprinter, fields))
+        else:
+            stale.append(path)
+    if stale:
+        for entry in read_database_content(database, password, backend, jobs, index.fingerprinter, fields,
+                                           PathSet(stale), timeout, retries):
+            records[entry.path] = (modified[entry.path], entry.fingerprinted(index.fingerprinter, fields))
+    index.store(database, password, fields, records)
+    return [records[path][1] for path in modified if path in records]
+
+
+def save_manifest(path, manifest):
+    content = {'version': MANIFEST_VERSION, 'salt': manifest.salt, 'fields': list(manifest.fields),
+               'entries': [[entry.path] + [entry.field_value(field) for field in manifest.fields]
+                           for entry in manifest.entries]}
+    with open(path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(content, manifest_file, separators=(',', ':'))
+
+
+def load_manifest(path):
+    with open(path, encoding='utf-8') as manifest_file:
+        content = json.load(manifest_file)
+    if not isinstance(content, dict):
+        raise ValueError('%s is not a manifest' % path)
+    if content.get('version') != MANIFEST_VERSION:
+        raise ValueError('unsupported manifest version %s in %s' % (content.get('version'), path))
+    missing = [key for key in ('salt', 'fields', 'entries') if key not in content]
+    if missing:
+        raise ValueError('the manifest %s has no %s' % (path, ', '.join(missing)))
+    if not isinstance(content['salt'], str) or not isinstance(content['fields'], list):
+        raise ValueError('malformed manifest %s' % path)
+    fields = tuple(content['fields'])
+    unknown = set(fields) - set(DBEntry.FIELD_ATTRIBUTES)
+    if unknown:
+        raise ValueError('unknown fields %s in %s' % (', '.join(sorted(map(str, unknown))), path))
+    entries = []
+    for values in content['entries']:
+        if not isinstance(values, list) or len(values) != len(fields) + 1 or not isinstance(values[0], str):
+            raise ValueError('malformed entry %s in %s' % (json.dumps(values)[:40], path))
+        entry = DBEntry(values[0])
+        for field, value in zip(fields, values[1:]):
+            setattr(entry, DBEntry.FIELD_ATTRIBUTES[field], value)
+        entries.append(entry)
+    return Manifest(content['salt'], fields, entries)
+
+
+def create_manifest(database, password, secret, backend=BACKEND_EXPORT, jobs=1, fields=DBEntry.FIELDS,
+                    path_filter=None):
+    salt = secrets.token_hex(MANIFEST_SALT_SIZE)
+    fingerprinter = Fingerprinter.from_secret(secret, salt)
+    entries = [entry.fingerprinted(fingerprinter, fields)
+               for entry in read_database_content(database, password, backend, jobs, fingerprinter, fields,
+                                                  path_filter)]
+    return Manifest(salt, fields, entries)
+
+
+def read_database_against_manifest(manifest, secret, database, password, backend=BACKEND_EXPORT, jobs=1,
+                                   fields=DBEntry.FIELDS, path_filter=None):
+    missing = set(fields) - set(manifest.fields)
+    if missing:
+        raise ValueError('the manifest does not contain %s' % ', '.join(sorted(missing)))
+    fingerprinter = Fingerprinter.from_secret(secret, manifest.salt)
+    return [entry.fingerprinted(fingerprinter, fields)
+            for entry in read_database_content(database, password, backend, jobs, fingerprinter, fields,
+                                               path_filter)]
+
+
+def load_batch(path):
+    with open(path, encoding='utf-8') as batch_file:
+        if path.endswith(BATCH_YAML_SUFFIXES):
+            if yaml is None:
+                raise ValueError('PyYAML is needed to read %s' % path)
+            try:
+                content = yaml.safe_load(batch_file)
+            except yaml.YAMLError as error:
+                raise ValueError('invalid YAML in %s: %s' % (path, error))
+        else:
+            content = json.load(batch_file)
+    return parse_batch(content)
+
+
+def parse_batch(content):
+    # a hand written file, anything but the expected shape is reported as a plain error
+    if not isinstance(content, dict):
+        raise ValueError('a batch is a mapping with databases and pairs')
+    passwords = content.get('databases') or {}
+    if not isinstance(passwords, dict) or not all(isinstance(password, str) for password in passwords.values()):
+        raise ValueError('databases must map every database to its password')
+    passwords = dict(passwords)
+    pairs = []
+    if not isinstance(content.get('pairs') or [], list):
+        raise ValueError('pairs must be a list')
+    for pair in content.get('pairs') or []:
+        if not isinstance(pair, dict):
+            raise ValueError('a pair is a mapping with first and second')
+        for database in (pair.get('first'), pair.get('second')):
+            if database not in passwords:
+                raise ValueError('no password for database %s' % database)
+        ignored = pair.get('ignore') or []
+        if not isinstance(ignored, list):
+            raise ValueError('ignore must be a list of fields')
+        unknown = set(ignored) - set(DBEntry.FIELDS)
+        if unknown:
+            raise ValueError('unknown fields %s' % ', '.join(sorted(map(str, unknown))))
+        pairs.append(BatchPair(pair['first'], pair['second'],
+                               tuple(field for field in DBEntry.FIELDS if field not in ignored),
+                               bool(pair.get('ignore_new_in_first')), bool(pair.get('ignore_new_in_second'))))
+    return Batch(passwords, pairs)
+
+
+def diff_batch(batch, backend=BACKEND_EXPORT, jobs=1, read=read_database_content, path_filter=None,
+               compact_entries=False, readers=BATCH_READERS):
+    # every database is read once with all fields any of its pairs compares, in the order the pairs first use them
+    needed = collections.defaultdict(set)
+    last_use = {}
+    for index, pair in enumerate(batch.pairs):
+        for database in (pair.first, pair.second):
+            needed[database].update(pair.fields)
+            last_use[database] = index
+
+    @STATS.profiled
+    def read_converted(database):
+        fields = tuple(field for field in DBEntry.FIELDS if field in needed[database])
+        with STATS.phase(Stats.PHASE_READ):
+            entries = read(database, batch.passwords[database], backend, jobs, fields=fields, path_filter=path_filter)
+            return convert(compact(entries, fields) if compact_entries else entries)
+
+    order = list(needed)
+    position = {database: index for index, database in enumerate(order)}
+    futures = {}
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=readers) as executor:
+        for index, pair in enumerate(batch.pairs):
+            # the pair's own databases plus a few ahead, so only those still to be compared are held
+            while submitted < min(len(order), max(position[pair.first], position[pair.second]) + 1 + readers):
+                futures[order[submitted]] = executor.submit(read_converted, order[submitted])
+                submitted += 1
+            first_database = futures[pair.first].result()
+            second_database = futures[pair.second].result()
+            for database in (pair.first, pair.second):
+                if last_use[database] == index:
+                    futures.pop(database, None)
+            with STATS.phase(Stats.PHASE_COMPARE):
+                yield pair, diff_tree(first_database, second_database, pair.fields)
+
+
+def diff_databases(first, first_password, second, second_password, backend=BACKEND_EXPORT, jobs=1,
+                   fields=DBEntry.FIELDS, path_filter=None):
+    batch = Batch({first: first_password, second: second_password},
+                  [BatchPair(first, second, tuple(fields), False, False)])
+    for _, results in diff_batch(batch, backend, jobs, path_filter=path_filter):
+        yield from results
+
+
+def compared_fields(args):
+    return (tuple(field for field in DBEntry.FIELDS if not getattr(args, 'ignore_' + field))
+            + tuple(field for field in DBEntry.EXTENDED_FIELDS if getattr(args, field)))
+
+
+def selected_paths(args):
+    if not args.include and not args.exclude:
+        return None
+    return PathFilter(args.include, args.exclude)
+
+
+def compact(entries, fields=DBEntry.FIELDS):
+    # the full entries are dropped as soon as they are read
+    for entry in entries:
+        yield CompactEntry.from_entry(entry, fields)
 
 
 def convert(database):
@@ -137,33 +1965,352 @@ def convert(database):
     return result
 
 
-def diff_dbs(argv):
-    args = parse_args(argv)
-    first_database = convert(read_database_content(args.database1, args.password1))
-    second_database = convert(read_database_content(args.database2, args.password2))
-    keys = set(first_database)
-    keys.union(set(second_database))
-    for key in keys:
-        first_entry = first_database[key]
-        second_entry = second_database[key]
-        if first_entry is None and second_entry is not None and args.ignore_new_in_second:
-            continue
-        else:
-            print('new entry in %s:%s', args.database2, second_entry.path)
-            continue
-        if first_entry is not None and second_entry is None and args.ignore_new_in_first:
+def diff_result(path, first_database, second_database, fields=DBEntry.FIELDS):
+    first_entry = first_database.get(path)
+    second_entry = second_database.get(path)
+    if second_entry is None:
+        return DiffResult(KIND_REMOVED, path, first_entry, None, [])
+    if first_entry is None:
+        return DiffResult(KIND_ADDED, path, None, second_entry, [])
+    return DiffResult(KIND_CHANGED, path, first_entry, second_entry, first_entry.differing_fields(second_entry, fields))
+
+
+def diff_tree(first_database, second_database, fields=DBEntry.FIELDS):
+    return diff_trees(MerkleTree(first_database, fields), MerkleTree(second_database, fields), first_database,
+                      second_database, fields)
+
+
+def diff_trees(first_tree, second_tree, first_database, second_database, fields=DBEntry.FIELDS):
+    different = []
+    pending = [MerkleTree.ROOT]
+    while pending:
+        group = pending.pop()
+        # identical subtrees are skipped as a whole
+        if first_tree.groups.get(group) == second_tree.groups.get(group):
             continue
+        first_entries, first_groups = first_tree.members.get(group, ((), ()))
+        second_entries, second_groups = second_tree.members.get(group, ((), ()))
+        for path in set(first_entries).union(second_entries):
+            if first_tree.entries.get(path) != second_tree.entries.get(path):
+                different.append(path)
+        pending.extend(set(first_groups).union(second_groups))
+    for path in sorted(different):
+        yield diff_result(path, first_database, second_database, fields)
+
+
+def diff_many(reference, others, fields=DBEntry.FIELDS):
+    # the reference is digested once and every other database is dropped as soon as it is compared
+    reference_tree = MerkleTree(reference, fields)
+    rows = {}
+    count = 0
+    for index, other in enumerate(others):
+        count += 1
+        for result in diff_trees(reference_tree, MerkleTree(other, fields), reference, other, fields):
+            rows.setdefault(result.path, {})[index] = result
+    for path in sorted(rows):
+        yield path, [rows[path].get(index) for index in range(count)]
+
+
+def has_content(entry, fields):
+    # an empty password still has a non-empty fingerprint, so it cannot tell empty entries apart
+    return any(entry.has_value(field) for field in fields if field != DBEntry.FIELD_PASSWORD)
+
+
+def detect_moves(results, fields=DBEntry.FIELDS):
+    # only unmatched entries are indexed, so this stays linear in the number of differences
+    results = list(results)
+    removed = [result for result in results if result.kind == KIND_REMOVED]
+    added = [result for result in results if result.kind == KIND_ADDED]
+    paired = []
+    content_fields = tuple(field for field in fields if field != DBEntry.FIELD_TITLE)
+    # same content and title first, then same content with any title, which needs some content to go by
+    for key_fields in (fields, content_fields):
+        index = collections.defaultdict(collections.deque)
+        for result in removed:
+            if key_fields is fields or has_content(result.first, key_fields):
+                index[result.first.digest(key_fields)].append(result)
+        matched = set()
+        unmatched = []
+        for result in added:
+            candidates = index.get(result.second.digest(key_fields))
+            if candidates:
+                old = candidates.popleft()
+                matched.add(old.path)
+                kind = KIND_MOVED if old.path.rpartition('/')[2] == result.path.rpartition('/')[2] else KIND_RENAMED
+                paired.append(DiffResult(kind, old.path, old.first, result.second,
+                                         old.first.differing_fields(result.second, fields)))
+            else:
+                unmatched.append(result)
+        removed = [result for result in removed if result.path not in matched]
+        added = unmatched
+    changed = [result for result in results if result.kind == KIND_CHANGED]
+    return sorted(changed + paired + removed + added, key=lambda result: result.path)
+
+
+def unique_paths(entries):
+    # like convert, the last of several entries with the same path wins
+    previous = None
+    for entry in entries:
+        if previous is not None and previous.path != entry.path:
+            yield previous
+        previous = entry
+    if previous is not None:
+        yield previous
+
+
+def merge_diff(first_entries, second_entries, fields=DBEntry.FIELDS):
+    first = unique_paths(first_entries)
+    second = unique_paths(second_entries)
+    first_entry = next(first, None)
+    second_entry = next(second, None)
+    while first_entry is not None or second_entry is not None:
+        if second_entry is None or (first_entry is not None and first_entry.path < second_entry.path):
+            yield DiffResult(KIND_REMOVED, first_entry.path, first_entry, None, [])
+            first_entry = next(first, None)
+        elif first_entry is None or second_entry.path < first_entry.path:
+            yield DiffResult(KIND_ADDED, second_entry.path, None, second_entry, [])
+            second_entry = next(second, None)
         else:
-            print('new entry in %s:%s', args.database1, first_entry.path)
+            differing = first_entry.differing_fields(second_entry, fields)
+            if differing:
+                yield DiffResult(KIND_CHANGED, first_entry.path, first_entry, second_entry, differing)
+            first_entry = next(first, None)
+            second_entry = next(second, None)
+
+
+def sort_entries(entries, fingerprinter=RUN_FINGERPRINTER, fields=DBEntry.FIELDS,
+                 run_size=SortedRuns.DEFAULT_RUN_SIZE):
+    # spilled runs must not contain plain values, so all entries are compared by fingerprint
+    return SortedRuns((entry.fingerprinted(fingerprinter, fields) for entry in entries), run_size)
+
+
+def moves_detected(args, results, fields):
+    return detect_moves(results, fields) if args.detect_moves else results
+
+
+def is_reported(args, result):
+    return not ((result.kind == KIND_REMOVED and args.ignore_new_in_first)
+                or (result.kind == KIND_ADDED and args.ignore_new_in_second))
+
+
+def result_message(args, second_name, result):
+    if result.kind == KIND_REMOVED:
+        return 'new entry in %s:%s' % (args.database1, result.path)
+    if result.kind == KIND_ADDED:
+        return 'new entry in %s:%s' % (second_name, result.path)
+    if result.kind in (KIND_MOVED, KIND_RENAMED):
+        return '%s:%s %s to %s:%s' % (args.database1, result.path, result.kind, second_name, result.second.path)
+    return '%s:%s and %s:%s differ' % (args.database1, result.path, second_name, result.path)
+
+
+def result_record(args, second_name, result):
+    record = {'kind': result.kind, 'path': result.path, 'first': args.database1, 'second': second_name,
+              'fields': list(result.fields)}
+    if result.kind in (KIND_MOVED, KIND_RENAMED):
+        record['new_path'] = result.second.path
+    return record
+
+
+def print_results(report, args, second_name, results, resolved=False):
+    for result in results:
+        report.add(args, second_name, result, resolved)
+
+
+def result_key(result):
+    # entries are read again after every change, a difference is identified by what it is about
+    return result.path, result.kind, result.second.path if result.second is not None else None, tuple(result.fields)
+
+
+def watch_diff(report, args, read, changes, fields):
+    # only the database that changed is read again, the other one and its tree are kept
+    sources = [(args.database1, args.password1), (args.database2, args.password2)]
+    databases = [read(database, password) for database, password in sources]
+    trees = [MerkleTree(database, fields) for database in databases]
+
+    def current_results():
+        with STATS.phase(Stats.PHASE_COMPARE):
+            results = moves_detected(args, diff_trees(trees[0], trees[1], databases[0], databases[1], fields), fields)
+            return {result_key(result): result for result in results}
+
+    reported = current_results()
+    print_results(report, args, args.database2, reported.values())
+    for changed in changes:
+        for index, (database, password) in enumerate(sources):
+            if database not in changed:
+                continue
+            try:
+                databases[index] = read(database, password)
+            except subprocess.CalledProcessError:
+                # most likely still being written, the next change reads it again
+                print('could not read %s, waiting for the next change' % database, file=sys.stderr, flush=True)
+                continue
+            trees[index] = MerkleTree(databases[index], fields)
+        results = current_results()
+        resolved = [reported[key] for key in sorted(reported.keys() - results.keys())]
+        appeared = [results[key] for key in sorted(results.keys() - reported.keys())]
+        print_results(report, args, args.database2, resolved, True)
+        print_results(report, args, args.database2, appeared)
+        reported = results
+
+
+def matrix_cell(result, in_reference):
+    if result is None:
+        return MATRIX_SAME if in_reference else MATRIX_ABSENT
+    if result.kind == KIND_REMOVED:
+        return MATRIX_MISSING
+    if result.kind == KIND_ADDED:
+        return MATRIX_NEW
+    return MATRIX_DIFFERS + ':' + ','.join(result.fields)
+
+
+def print_matrix(report, args, names, rows):
+    if report.output_format != FORMAT_TEXT:
+        # one record per database that differs, as if each had been compared on its own
+        for _, results in rows:
+            for name, result in zip(names, results):
+                if result is not None:
+                    report.add(args, name, result)
+        return
+    header = '\t'.join([args.database1] + names)
+    for path, results in rows:
+        # a row has at least one result, and all of them agree on whether the reference has the entry
+        in_reference = any(result is not None and result.kind != KIND_ADDED for result in results)
+        results = [result if result is not None and is_reported(args, result) else None for result in results]
+        if all(result is None for result in results):
             continue
-        if not first_entry.is_same(second_entry,
-                                   args.ignore_title,
-                                   args.ignore_username,
-                                   args.ignore_password,
-                                   args.ignore_url,
-                                   args.ignore_notes):
-            print('%s:%s and %s:%s differ', args.database1, first_entry.path, args.database2, second_entry.path)
+        # identical databases print nothing at all, like a single comparison
+        if not report.differences:
+            report.write(header)
+        report.differences += 1
+        report.write('\t'.join([path] + [matrix_cell(result, in_reference) for result in results]))
+
+
+def diff_dbs(argv):
+    args = parse_args(argv)
+    STATS.reset(args.stats or args.stats_json is not None, args.profile is not None)
+    report = Report(args.format)
+    try:
+        STATS.profiled(run_diff)(args, report)
+        report.close()
+        return report.exit_code
+    finally:
+        if args.stats:
+            STATS.print_report(sys.stderr)
+        if args.stats_json is not None:
+            STATS.save_report(args.stats_json)
+        if args.profile is not None:
+            STATS.dump_profile(args.profile)
+        STATS.reset()
+
+
+def run_diff(args, report):
+    fields = compared_fields(args)
+    path_filter = selected_paths(args)
+    if args.write_manifest is not None:
+        with STATS.phase(Stats.PHASE_READ):
+            manifest = create_manifest(args.database1, args.password1, args.manifest_key, args.backend, args.jobs,
+                                       fields, path_filter)
+        save_manifest(args.write_manifest, manifest)
+        return
+    if args.baseline is not None:
+        manifest = load_manifest(args.baseline)
+        with STATS.phase(Stats.PHASE_READ):
+            first_database = convert(read_database_against_manifest(manifest, args.manifest_key, args.database1,
+                                                                     args.password1, args.backend, args.jobs,
+                                                                     fields, path_filter))
+        second_database = convert(entry for entry in manifest.entries
+                                  if path_filter is None or path_filter.matches(entry.path))
+        with STATS.phase(Stats.PHASE_COMPARE):
+            print_results(report, args, args.baseline,
+                          moves_detected(args, diff_tree(first_database, second_database, fields), fields))
+        return
+    if args.cache_dir is not None:
+        cache = SnapshotCache(args.cache_dir, args.cache_max_size)
+        if args.cache_clear:
+            cache.clear()
+        read = functools.partial(read_database_cached, cache, path_filter=path_filter, timeout=args.timeout,
+                                 retries=args.retries)
+    elif args.index_dir is not None:
+        read = functools.partial(read_database_indexed, EntryIndex(args.index_dir), path_filter=path_filter,
+                                 timeout=args.timeout, retries=args.retries)
+    else:
+        read = functools.partial(iter_database_content, fingerprinter=RUN_FINGERPRINTER, path_filter=path_filter,
+                                 timeout=args.timeout, retries=args.retries)
+    # only the paths and the names of the differing fields are printed, resolving attachments needs the full entries
+    compact_entries = not args.attachments
+    if args.batch is not None:
+        for pair, results in diff_batch(load_batch(args.batch), args.backend, args.jobs, read, path_filter,
+                                        compact_entries):
+            pair_args = argparse.Namespace(database1=pair.first, ignore_new_in_first=pair.ignore_new_in_first,
+                                           ignore_new_in_second=pair.ignore_new_in_second)
+            print_results(report, pair_args, pair.second, moves_detected(args, results, pair.fields))
+        return
+    if args.stream:
+
+        @STATS.profiled
+        def read_sorted(database, password):
+            with STATS.phase(Stats.PHASE_READ):
+                return sort_entries(read(database, password, args.backend, args.jobs, fields=fields),
+                                    RUN_FINGERPRINTER, fields, args.run_size)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first_future = executor.submit(read_sorted, args.database1, args.password1)
+            second_future = executor.submit(read_sorted, args.database2, args.password2)
+            with first_future.result() as first_runs, second_future.result() as second_runs:
+                with STATS.phase(Stats.PHASE_COMPARE):
+                    print_results(report, args, args.database2,
+                                  moves_detected(args, merge_diff(first_runs, second_runs, fields), fields))
+        return
+
+    @STATS.profiled
+    def read_converted(database, password):
+        with STATS.phase(Stats.PHASE_READ):
+            entries = read(database, password, args.backend, args.jobs, fields=fields)
+            return convert(compact(entries, fields) if compact_entries else entries)
+
+    if args.others:
+        databases = [args.database2] + [database for database, _ in args.others]
+        passwords = [args.password2] + [password for _, password in args.others]
+        # every database is read exactly once and all of them are read concurrently
+        with ThreadPoolExecutor(max_workers=len(databases) + 1) as executor:
+            reference_future = executor.submit(read_converted, args.database1, args.password1)
+            others = executor.map(read_converted, databases, passwords)
+            with STATS.phase(Stats.PHASE_COMPARE):
+                print_matrix(report, args, databases, diff_many(reference_future.result(), others, fields))
+        return
+
+    if args.watch:
+        with FileWatcher([args.database1, args.database2], args.watch_debounce, args.watch_interval) as watcher:
+            try:
+                watch_diff(report, args, read_converted, watcher.changes(), fields)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first_future = executor.submit(read_converted, args.database1, args.password1)
+        second_future = executor.submit(read_converted, args.database2, args.password2)
+        first_database = first_future.result()
+        second_database = second_future.result()
+    if args.attachments:
+        resolve_attachments(first_database, second_database, (args.database1, args.password1),
+                            (args.database2, args.password2), args.jobs)
+    with STATS.phase(Stats.PHASE_COMPARE):
+        print_results(report, args, args.database2,
+                      moves_detected(args, diff_tree(first_database, second_database, fields), fields))
+
+
+def main(argv):
+    try:
+        return diff_dbs(argv)
+    except (subprocess.SubprocessError, OSError, ValueError) as error:
+        print('error: %s' % error, file=sys.stderr)
+        return EXIT_ERROR
+    except Exception:
+        # a crash must not be taken for 'the databases differ'
+        traceback.print_exc()
+        return EXIT_ERROR
 
 
 if __name__ == "__main__":
-    diff_dbs(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+import csv
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree
+
+COMMAND = [sys.executable, os.path.abspath(__file__)]
+LATENCY_VARIABLE = 'FAKE_KEEPASSXC_LATENCY'
+UNLOCK_COST_VARIABLE = 'FAKE_KEEPASSXC_UNLOCK_COST'
+LOG_VARIABLE = 'FAKE_KEEPASSXC_LOG'
+ROOT_GROUP = 'Root'
+SHOW_ATTRIBUTES = [('Title', 'title'), ('UserName', 'username'), ('Password', 'password'), ('URL', 'url'),
+                   ('Notes', 'notes')]
+EXPORT_HEADER = ['Group', 'Title', 'Username', 'Password', 'URL', 'Notes', 'TOTP', 'Icon', 'Last Modified',
+                 'Created']
+
+
+class CommandError(Exception):
+    pass
+
+
+class FakeDatabase:
+
+    def __init__(self, name, entries, groups=()):
+        self.name = name
+        self.entries = entries
+        for entry in self.entries:
+            entry.setdefault('title', entry['path'].split('/')[-1])
+        self.groups = list(groups)
+
+    @classmethod
+    def load(cls, path, password):
+        with open(path, encoding='utf-8') as database_file:
+            content = json.load(database_file)
+        if password != content.get('password', ''):
+            raise CommandError('Error while reading the database: Invalid credentials were provided, '
+                               'please try again.')
+        return cls(content.get('name', ''), content.get('entries', []), content.get('groups', []))
+
+    @classmethod
+    def save(cls, path, password, entries, name='', groups=()):
+        with open(path, 'w', encoding='utf-8') as database_file:
+            json.dump({'name': name, 'password': password, 'groups': list(groups), 'entries': entries},
+                      database_file)
+
+    def find_entry(self, path):
+        path = path.lstrip('/')
+        for entry in self.entries:
+            if entry['path'] == path:
+                return entry
+        raise CommandError('Could not find entry with path %s.' % path)
+
+    def tree(self):
+        root = ({}, [])
+        for group in self.groups:
+            self._group_node(root, [name for name in group.split('/') if name])
+        for entry in self.entries:
+            names = entry['path'].split('/')
+            self._group_node(root, names[:-1])[1].append(names[-1])
+        return root
+
+    @classmethod
+    def _group_node(cls, root, names):
+        node = root
+        for name in names:
+            node = node[0].setdefault(name, ({}, []))
+        return node
+
+    def ls(self, recursive, flatten):
+        lines = []
+        self._ls(self.tree(), [], recursive, flatten, lines)
+        return lines
+
+    def _ls(self, node, names, recursive, flatten, lines):
+        prefix = ''.join(name + '/' for name in names) if flatten else '  ' * len(names)
+        for title in node[1]:
+            lines.append(prefix + title)
+        for name, child in node[0].items():
+            lines.append(prefix + name + '/')
+            if recursive:
+                self._ls(child, names + [name], recursive, flatten, lines)
+
+    def show(self, path, show_protected, attributes, show_all=False, show_attachments=False):
+        entry = self.find_entry(path)
+        custom = entry.get('attributes', {})
+        if attributes:
+            names = dict(SHOW_ATTRIBUTES)
+            lines = []
+            for attribute in attributes:
+                if attribute in names:
+                    lines.append(entry.get(names[attribute], ''))
+                elif attribute in custom:
+                    lines.append(custom[attribute])
+                else:
+                    raise CommandError('ERROR: unknown attribute %s.' % attribute)
+            return lines
+        lines = []
+        for header, key in SHOW_ATTRIBUTES:
+            value = entry.get(key, '')
+            if key == 'password' and not show_protected:
+                value = 'PROTECTED'
+            lines.append('%s: %s' % (header, value))
+        if show_all:
+            for name in sorted(custom):
+                lines.append('%s: %s' % (name, custom[name]))
+        if show_attachments:
+            attachments = entry.get('attachments', {})
+            lines.append('')
+            if not attachments:
+                lines.append('No attachments present.')
+            else:
+                lines.append('Attachments:')
+                for name in sorted(attachments):
+                    lines.append('  %s (%s)' % (name, human_readable_size(len(attachments[name].encode()))))
+        return lines
+
+    def attachment(self, path, name):
+        attachments = self.find_entry(path).get('attachments', {})
+        if name not in attachments:
+            raise CommandError('Could not find attachment with name %s.' % name)
+        return attachments[name]
+
+    def export_csv(self, output):
+        writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        writer.writerow(EXPORT_HEADER)
+        for entry in self.entries:
+            names = entry['path'].split('/')
+            writer.writerow(['/'.join([ROOT_GROUP] + names[:-1]), entry['title'],
+                             entry.get('username', ''), entry.get('password', ''), entry.get('url', ''),
+                             entry.get('notes', ''), '', '0', entry.get('last_modified', ''),
+                             entry.get('created', '')])
+
+    def export_xml(self, output):
+        # the layout of a KDBX 3.1 XML file, attachments are kept in the meta data and referenced by the entries,
+        # the history holds earlier versions of an entry
+        root = xml.etree.ElementTree.Element('KeePassFile')
+        meta = xml.etree.ElementTree.SubElement(root, 'Meta')
+        xml.etree.ElementTree.SubElement(meta, 'Generator').text = 'KeePassXC'
+        binaries = xml.etree.ElementTree.SubElement(meta, 'Binaries')
+        groups = {(): self._xml_group(xml.etree.ElementTree.SubElement(root, 'Root'), ROOT_GROUP)}
+        for group in self.groups:
+            self._xml_group_node(groups, tuple(name for name in group.split('/') if name))
+        for entry in self.entries:
+            names = tuple(entry['path'].split('/'))
+            element = self._xml_entry(self._xml_group_node(groups, names[:-1]), entry, binaries)
+            history = xml.etree.ElementTree.SubElement(element, 'History')
+            for previous in entry.get('history', []):
+                self._xml_entry(history, dict(entry, **previous), binaries)
+        output.write(xml.etree.ElementTree.tostring(root, encoding='unicode'))
+
+    @classmethod
+    def _xml_group(cls, parent, name):
+        group = xml.etree.ElementTree.SubElement(parent, 'Group')
+        xml.etree.ElementTree.SubElement(group, 'Name').text = name
+        return group
+
+    @classmethod
+    def _xml_group_node(cls, groups, names):
+        if names not in groups:
+            groups[names] = cls._xml_group(cls._xml_group_node(groups, names[:-1]), names[-1])
+        return groups[names]
+
+    @classmethod
+    def _xml_entry(cls, parent, entry, binaries):
+        element = xml.etree.ElementTree.SubElement(parent, 'Entry')
+        strings = [(header, entry.get(key, '')) for header, key in SHOW_ATTRIBUTES]
+        for key, value in strings + sorted(entry.get('attributes', {}).items()):
+            string = xml.etree.ElementTree.SubElement(element, 'String')
+            xml.etree.ElementTree.SubElement(string, 'Key').text = key
+            xml.etree.ElementTree.SubElement(string, 'Value').text = value
+        for name, content in sorted(entry.get('attachments', {}).items()):
+            identifier = str(len(binaries))
+            xml.etree.ElementTree.SubElement(binaries, 'Binary', ID=identifier, Compressed='False').text = \
+                base64.b64encode(content.encode()).decode()
+            binary = xml.etree.ElementTree.SubElement(element, 'Binary')
+            xml.etree.ElementTree.SubElement(binary, 'Key').text = name
+            xml.etree.ElementTree.SubElement(binary, 'Value', Ref=identifier)
+        return element
+
+
+def human_readable_size(size):
+    # mirrors Tools::humanReadableFileSize with a precision of one
+    units = ['B', 'KiB', 'MiB', 'GiB']
+    index = 0
+    while size >= 1024 and index < len(units) - 1:
+        size /= 1024
+        index += 1
+    return '%.1f %s' % (size, units[index])
+
+
+def split_command(command):
+    # mirrors the argument splitting of the keepassxc-cli interactive mode
+    result = []
+    current = ''
+    inside_quotes = False
+    for index, char in enumerate(command):
+        if char == '"' and (index == 0 or command[index - 1] != '\\'):
+            inside_quotes = not inside_quotes
+        elif char == ' ' and not inside_quotes:
+            if current:
+                result.append(current)
+            current = ''
+        else:
+            current += char
+    if current:
+        result.append(current)
+    return result
+
+
+def create_parser(interactive):
+    parser = argparse.ArgumentParser(prog='keepassxc-cli')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    ls = subparsers.add_parser('ls')
+    ls.add_argument('-R', '--recursive', action='store_true')
+    ls.add_argument('-f', '--flatten', action='store_true')
+    show = subparsers.add_parser('show')
+    show.add_argument('-s', '--show-protected', dest='show_protected', action='store_true')
+    show.add_argument('-a', '--attributes', dest='attributes', action='append', default=[])
+    show.add_argument('--all', dest='show_all', action='store_true')
+    show.add_argument('--show-attachments', dest='show_attachments', action='store_true')
+    if interactive:
+        subparsers.add_parser('exit')
+        subparsers.add_parser('quit')
+    else:
+        export = subparsers.add_parser('export')
+        export.add_argument('-f', '--format', dest='format', default='xml')
+        open_ = subparsers.add_parser('open')
+        attachment_export = subparsers.add_parser('attachment-export')
+        attachment_export.add_argument('--stdout', dest='stdout', action='store_true')
+        for subparser in (ls, show, export, open_, attachment_export):
+            subparser.add_argument('database')
+        attachment_export.add_argument('entry')
+        attachment_export.add_argument('name')
+        attachment_export.add_argument('export_file', nargs='?')
+    show.add_argument('entry')
+    return parser
+
+
+def read_password(stream):
+    line = stream.readline()
+    return line[:-1] if line.endswith('\n') else line
+
+
+def simulate_cost(variable):
+    seconds = float(os.environ.get(variable, 0))
+    if seconds:
+        time.sleep(seconds)
+
+
+def log_process(argv):
+    path = os.environ.get(LOG_VARIABLE)
+    if path:
+        with open(path, 'a', encoding='utf-8') as log_file:
+            log_file.write(' '.join(argv[:1]) + '\n')
+
+
+def run_command(database, args, output):
+    simulate_cost(LATENCY_VARIABLE)
+    if args.command == 'ls':
+        lines = database.ls(args.recursive, args.flatten)
+    elif args.command == 'show':
+        lines = database.show(args.entry, args.show_protected, args.attributes, args.show_all, args.show_attachments)
+    elif args.command == 'attachment-export':
+        content = database.attachment(args.entry, args.name)
+        if not args.stdout:
+            with open(args.export_file, 'w', encoding='utf-8') as export_file:
+                export_file.write(content)
+            return
+        output.write(content)
+        return
+    else:
+        if args.format == 'csv':
+            database.export_csv(output)
+        elif args.format == 'xml':
+            database.export_xml(output)
+        else:
+            raise CommandError('Unsupported format %s.' % args.format)
+        return
+    for line in lines:
+        output.write(line + '\n')
+
+
+def interactive(database, stdin, stdout, stderr):
+    parser = create_parser(True)
+    prompt = (database.name or 'database') + '> '
+    while True:
+        stdout.write(prompt)
+        stdout.flush()
+        line = stdin.readline()
+        if not line:
+            return 0
+        arguments = split_command(line.rstrip('\n'))
+        if not arguments:
+            continue
+        try:
+            args = parser.parse_args(arguments)
+        except SystemExit:
+            continue
+        if args.command in ('exit', 'quit'):
+            return 0
+        try:
+            run_command(database, args, stdout)
+        except CommandError as error:
+            stderr.write(str(error) + '\n')
+            stderr.flush()
+
+
+def main(argv, stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr):
+    args = create_parser(False).parse_args(argv)
+    log_process(argv)
+    stderr.write('Enter password to unlock %s: \n' % args.database)
+    try:
+        password = read_password(stdin)
+        simulate_cost(UNLOCK_COST_VARIABLE)
+        database = FakeDatabase.load(args.database, password)
+        if args.command == 'open':
+            return interactive(database, stdin, stdout, stderr)
+        run_command(database, args, stdout)
+    except CommandError as error:
+        stderr.write(str(error) + '\n')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))